@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+"""
+This module measures the memory footprint per simulated device, of the threaded and the compact representation,
+counts the threads both start and computes the message rate a fleet of that size has to sustain.
+
+Usage: benchmark.py [number_of_devices]
+"""
+
+from telemetry.device.compact import compact_device_classes
+import telemetry.device.simulated as SimulatedDevices
+import tracemalloc
+import threading
+import math
+import sys
+
+# a well-formed key, the clients never connect
+shared_access_key = 'A' * 43 + '='
+
+# creating the SDK clients is slow, so their footprint is measured for a sample of the devices
+client_sample_size = 1000
+
+# round trip time of sending a message to the hub, until its acknowledgement arrives
+round_trip_in_secs = 0.05
+
+# stack reserved per thread, unless set with threading.stack_size, the default of glibc on Linux
+default_stack_size_in_bytes = 8 * 1024 * 1024
+
+
+def create_device_ids(count: int):
+    """
+    Creates the ids of a farm with one soil sensor and one irrigation controller per garden bed.
+    """
+    device_ids = ['AirSensorsDevice', 'HeaterController', 'WindowController']
+
+    for bed in range(1, (count - len(device_ids)) // 2 + 1):
+        device_ids += [f'SoilSensorsDevice-{bed}', f'IrrigationController-{bed}']
+
+    return device_ids
+
+
+def measure_bytes_per_device(device_ids, create_device, with_client: bool = False) -> float:
+    """
+    Measures the memory allocated per created device. The SDK clients are created on first use, so they are only
+    included with with_client. Neither includes what a connected client adds (its network threads and buffers),
+    nor the stacks of started threads, see count_started_threads.
+    """
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+
+    devices = [create_device(device_id, f'HostName=benchmark;DeviceId={device_id};SharedAccessKey={shared_access_key}')
+               for device_id in device_ids]
+
+    if with_client:
+        for device in devices:
+            device.client
+
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return (after - before) / len(devices)
+
+
+def count_started_threads(device_ids, compact: bool, workers: int) -> int:
+    """
+    Counts the threads, that running the devices starts. A threaded device runs in its own thread and receives
+    commands in another one. A compact fleet starts its workers and one receiving thread per controller.
+    """
+    if not compact:
+        return 2 * len(device_ids)
+
+    controllers = sum(compact_device_classes[device_id.partition('-')[0]].receives_commands
+                      for device_id in device_ids)
+    return workers + controllers
+
+
+def create_threaded_device(device_id: str, connection_string: str):
+    device_type, _, _ = device_id.partition('-')
+    return getattr(SimulatedDevices, device_type)(device_id, connection_string)
+
+
+def create_compact_device(device_id: str, connection_string: str):
+    device_type, _, _ = device_id.partition('-')
+    return compact_device_classes[device_type](device_id, connection_string)
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    device_ids = create_device_ids(count)
+    sample = device_ids[:client_sample_size]
+
+    environment = SimulatedDevices.create_environment(device_ids)
+    environment_bytes = sum(array.nbytes for array in (
+        environment.air_temperature, environment.air_humidity, environment.soil_vwc, environment.soil_pH,
+        environment.base_soil_pH, environment.heater_until, environment.window_until,
+        environment.irrigation_until))
+
+    # every sensor sends one message per interval, each worker of a fleet sends one message per round trip
+    messages_per_sec = sum(1 / compact_device_classes[device_id.partition('-')[0]].interval_in_secs
+                           for device_id in device_ids
+                           if compact_device_classes[device_id.partition('-')[0]].interval_in_secs)
+
+    print(f'devices:                        {len(device_ids)}')
+    print(f'environment:                    {environment_bytes / len(device_ids):10.1f} bytes per device')
+    print(f'compact devices:                '
+          f'{measure_bytes_per_device(device_ids, create_compact_device):10.1f} bytes per device')
+    print(f'compact devices with clients:   '
+          f'{measure_bytes_per_device(sample, create_compact_device, with_client=True):10.1f} bytes per device')
+    print(f'threaded devices:               '
+          f'{measure_bytes_per_device(device_ids, create_threaded_device):10.1f} bytes per device')
+    print(f'threaded devices with clients:  '
+          f'{measure_bytes_per_device(sample, create_threaded_device, with_client=True):10.1f} bytes per device')
+    print('(without the network threads and buffers of connected clients)')
+
+    workers = max(1, math.ceil(messages_per_sec * round_trip_in_secs))
+    stack_size_in_bytes = threading.stack_size() or default_stack_size_in_bytes
+
+    for name, compact in (('compact', True), ('threaded', False)):
+        threads = count_started_threads(device_ids, compact, workers)
+        print(f'{name + " threads:":32}{threads:10d} threads, '
+              f'{threads * stack_size_in_bytes / len(device_ids):.1f} bytes of stack per device')
+
+    print('(stacks are reserved virtual memory, only their touched pages become resident)')
+    print(f'required message rate:          {messages_per_sec:10.1f} messages per second, '
+          f'that is {workers} workers at a round trip time of {round_trip_in_secs * 1000:.0f} ms')
@@ -25,3 +25,11 @@ DEVICE_CONNECTION_STRINGS_FILE = os.path.join(
     ROOT_DIR, 'device-connection-strings')
 DEVICE_CONNECTION_STRINGS = read_connection_string_file(
     DEVICE_CONNECTION_STRINGS_FILE, keyname='DeviceId')
+
+# run the devices in the compact representation, to simulate large fleets
+COMPACT_DEVICES = os.environ.get(
+    'SMART_GREENHOUSE_COMPACT_DEVICES', '').lower() in ('1', 'true', 'yes')
+# each worker sends one message at a time, so large fleets need many workers
+COMPACT_WORKERS = int(os.environ.get('SMART_GREENHOUSE_COMPACT_WORKERS', 4))
+# simulated seconds per second, e.g. 60 to see irrigation and heating quickly on the dashboard
+TIME_SCALE = float(os.environ.get('SMART_GREENHOUSE_TIME_SCALE', 1))
@@ -4,9 +4,12 @@
 This module is used to simluate telemetry.
 """
 
-from definitions import DEVICE_CONNECTION_STRINGS
+from definitions import DEVICE_CONNECTION_STRINGS, COMPACT_DEVICES, COMPACT_WORKERS, TIME_SCALE
 import telemetry.device.simulated as SimulatedDevices
+from telemetry.device.compact import CompactFleet
+from telemetry.utils.log import start_queue_logging, SamplingFilter
 import threading
+import atexit
 import logging
 
 app_name = 'telemetry'
@@ -19,21 +22,36 @@ sh_formatter = logging.Formatter(
     fmt='[{asctime}] [{levelname:^8}]: <{threadName}>: {message}',
     style='{')
 sh.setFormatter(sh_formatter)
-logger.addHandler(sh)
+log_listener = start_queue_logging(logger, [sh])
+atexit.register(log_listener.stop)
+
+# log 1 in 10 messages, warnings and errors are always logged
+logging.getLogger('telemetry.device.simulated.messages').addFilter(
+    SamplingFilter(10))
+
+SimulatedDevices.create_environment(
+    DEVICE_CONNECTION_STRINGS.keys(), time_scale=TIME_SCALE)
 
 logger.info('starting simulated devices, press Ctrl-C to exit')
 running_devices = []
 
-for device_id, connection_string in DEVICE_CONNECTION_STRINGS.items():
-    device_type, _, _ = device_id.partition('-')
-    device_to_use = getattr(SimulatedDevices, device_type)
+if COMPACT_DEVICES:
+    # a pool of threads for all devices instead of one per device
+    fleet = CompactFleet.create_from_connection_strings(
+        DEVICE_CONNECTION_STRINGS, workers=COMPACT_WORKERS)
+    fleet.start()
+    running_devices.append(fleet)
+else:
+    for device_id, connection_string in DEVICE_CONNECTION_STRINGS.items():
+        device_type, _, _ = device_id.partition('-')
+        device_to_use = getattr(SimulatedDevices, device_type)
 
-    if device_to_use:
-        device = device_to_use(device_id, connection_string)
-        device.start()
-        running_devices.append(device)
-    else:
-        logger.warning(f"No simulated device '{device_type}' exists.")
+        if device_to_use:
+            device = device_to_use(device_id, connection_string)
+            device.start()
+            running_devices.append(device)
+        else:
+            logger.warning(f"No simulated device '{device_type}' exists.")
 
 interrupt_event = threading.Event()
 
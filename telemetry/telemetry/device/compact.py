@@ -0,0 +1,284 @@
+"""
+This module provides a compact representation of the simulated devices, to simulate fleets of 100k devices on a
+single machine.
+
+A compact device is not a thread. It only holds its id, connection string, location in the environment and
+the monotonic time of its next message in __slots__. Everything else is shared per class: the mock values are
+read from the shared environment's arrays, the logger is a class attribute and the SDK client is created on first
+use. The behaviour (building messages, executing commands) is borrowed from the classes in
+telemetry.device.simulated, so both representations behave alike.
+
+A CompactFleet sends the messages of all sensors from a pool of worker threads. Only controllers receive commands,
+each of them in its own daemonic thread, because the SDK's receive call blocks per client. So direct methods of the
+sensors, like reset_soil_humidity, are not available, and the reserved profiling method has to be invoked on a
+controller.
+
+Each device still needs a client of its own, as the hub authenticates every connection as a single device. Once
+connected, the clients and their network threads dominate the memory of a fleet. Each worker sends one message at a
+time and waits for the hub's acknowledgement, so a fleet sends at most about workers / round trip time messages per
+second. If sending falls behind, messages are skipped and a warning is logged.
+
+---
+
+Module variables:
+    compact_device_classes: The compact device classes by device type.
+"""
+
+from typing import Dict, Iterable, List, Type
+import threading
+import logging
+import heapq
+import time
+
+from azure.iot.device import IoTHubDeviceClient
+from telemetry.environment import parse_location
+import telemetry.device.simulated as simulated
+
+
+class CompactDevice:
+    """
+    Abstract base class for a compact simulated device.
+
+    ---
+
+    Attributes:
+        device_id: A string representing the device's id, with which it is registered at the hub.
+        connection_string: The connection string, that is used to connect to the hub.
+        greenhouse: Index of the greenhouse in the environment, the device belongs to.
+        bed: Index of the garden bed in the environment, the device belongs to.
+        next_msg_at: Monotonic time, at which to send the next message.
+        client: An IoTHubDeviceClient, that handles the communication with the hub. Created on first use.
+    """
+
+    __slots__ = ('device_id', 'connection_string',
+                 'greenhouse', 'bed', 'next_msg_at', '_client')
+
+    # shared by all devices of a class instead of stored per instance
+    logger = logging.getLogger(simulated.__name__)
+    bed_level = False
+    interval_in_secs = 0
+    # sensors do not receive commands, to save a thread per sensor
+    receives_commands = False
+
+    def __init__(self, device_id: str, connection_string: str):
+        self.device_id = device_id
+        self.connection_string = connection_string
+        self.greenhouse, self.bed = parse_location(device_id, self.bed_level)
+        self.next_msg_at = 0.0
+        self._client = None
+
+    @property
+    def name(self) -> str:
+        return self.device_id
+
+    @property
+    def client(self) -> IoTHubDeviceClient:
+        """
+        Returns:
+            The communication client, it is created on first use.
+        """
+        if self._client is None:
+            self._client = IoTHubDeviceClient.create_from_connection_string(
+                self.connection_string)
+
+        return self._client
+
+    send_msg = simulated.Device.send_msg
+    recv_command = simulated.Device.recv_command
+    handle_method_request = simulated.Device.handle_method_request
+    _start_profiling = simulated.Device._start_profiling
+
+    def send_data(self):
+        """
+        Sends the devices sensor data to the hub. Can be implemented in a
+        subclass.
+        """
+        pass
+
+
+class CompactSoilSensorsDevice(CompactDevice):
+    __slots__ = ()
+
+    bed_level = True
+    interval_in_secs = 5
+
+    get_soil_humidity = simulated.SoilSensorsDevice.get_soil_humidity
+    get_soil_pH = simulated.SoilSensorsDevice.get_soil_pH
+    send_data = simulated.SoilSensorsDevice.send_data
+
+
+class CompactAirSensorsDevice(CompactDevice):
+    __slots__ = ()
+
+    interval_in_secs = 5
+
+    get_relative_air_humidity = simulated.AirSensorsDevice.get_relative_air_humidity
+    get_temperature = simulated.AirSensorsDevice.get_temperature
+    send_data = simulated.AirSensorsDevice.send_data
+
+
+class CompactIrrigationController(CompactDevice):
+    __slots__ = ()
+
+    bed_level = True
+    receives_commands = True
+
+    turn_on = simulated.IrrigationController.turn_on
+    turn_off = simulated.IrrigationController.turn_off
+
+
+class CompactHeaterController(CompactDevice):
+    __slots__ = ()
+
+    receives_commands = True
+
+    turn_on = simulated.HeaterController.turn_on
+    turn_off = simulated.HeaterController.turn_off
+
+
+class CompactWindowController(CompactDevice):
+    __slots__ = ()
+
+    receives_commands = True
+
+    open = simulated.WindowController.open
+    close = simulated.WindowController.close
+
+
+compact_device_classes: Dict[str, Type[CompactDevice]] = {
+    'SoilSensorsDevice': CompactSoilSensorsDevice,
+    'AirSensorsDevice': CompactAirSensorsDevice,
+    'IrrigationController': CompactIrrigationController,
+    'HeaterController': CompactHeaterController,
+    'WindowController': CompactWindowController,
+}
+
+
+class CompactFleet:
+    """
+    Runs a fleet of compact devices. Sensors are spread over a few worker threads, each of which sends the
+    messages of its devices in order of their due time.
+
+    ---
+
+    Attributes:
+        devices: The devices of the fleet.
+        workers: Number of threads sending the sensors' messages.
+        sent: Number of messages sent by each worker.
+        skipped: Number of messages each worker skipped, because it fell behind.
+    """
+
+    # log at most one warning per worker in this interval, when sending falls behind
+    behind_warning_interval_in_secs = 60
+
+    def __init__(self, devices: Iterable[CompactDevice], workers: int = 4):
+        """
+        Initializes the fleet.
+
+        ---
+
+        Args:
+            devices: The devices to run.
+            workers: Number of threads sending the sensors' messages.
+        """
+        self.devices: List[CompactDevice] = list(devices)
+        self.workers = workers
+        self.sent = [0] * workers
+        self.skipped = [0] * workers
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        """
+        Starts the worker threads and a receiving thread per controller. The first messages of the sensors are
+        spread evenly over their interval, to avoid bursts.
+        """
+        sensors = [device for device in self.devices if device.interval_in_secs > 0]
+        now = time.monotonic()
+
+        for i, device in enumerate(sensors):
+            device.next_msg_at = now + device.interval_in_secs * i / len(sensors)
+
+        for i in range(min(self.workers, len(sensors))):
+            self._start_thread(f'CompactFleet-{i}', self._send_loop, i, sensors[i::self.workers], daemon=False)
+
+        for device in self.devices:
+            if device.receives_commands:
+                self._start_thread(device.device_id, device.recv_command, daemon=True)
+
+    def join(self):
+        """
+        Waits for the worker threads, receiving threads are not waited for.
+        """
+        for thread in self._threads:
+            if not thread.daemon:
+                thread.join()
+
+    def _start_thread(self, name: str, target, *args, daemon: bool):
+        thread = threading.Thread(target=target, name=name, args=args, daemon=daemon)
+        thread.start()
+        self._threads.append(thread)
+
+    def _send_loop(self, worker: int, devices: List[CompactDevice]):
+        """
+        Sends the messages of the given devices, when they are due, until the shutdown is initiated.
+        """
+        # the index breaks ties, devices themselves are not comparable
+        due = [(device.next_msg_at, i) for i, device in enumerate(devices)]
+        heapq.heapify(due)
+
+        warned_at = float('-inf')
+        skipped_since_warning = 0
+
+        while not simulated.shutdown_initiated.wait(timeout=max(0, due[0][0] - time.monotonic())):
+            now = time.monotonic()
+
+            while due[0][0] <= now:
+                _, i = due[0]
+                device = devices[i]
+
+                try:
+                    device.send_data()
+                    self.sent[worker] += 1
+                except Exception as err:
+                    device.logger.warning(f"'{device.device_id}' failed to send data: {err}")
+
+                # do not try to catch up on missed messages, if sending falls behind
+                device.next_msg_at += device.interval_in_secs
+                if device.next_msg_at <= now:
+                    skipped = int((now - device.next_msg_at) // device.interval_in_secs) + 1
+                    self.skipped[worker] += skipped
+                    skipped_since_warning += skipped
+                    device.next_msg_at = now + device.interval_in_secs
+
+                heapq.heapreplace(due, (device.next_msg_at, i))
+
+            if skipped_since_warning and now - warned_at >= self.behind_warning_interval_in_secs:
+                CompactDevice.logger.warning(
+                    f'sending falls behind, skipped {skipped_since_warning} messages, consider more workers')
+                warned_at = now
+                skipped_since_warning = 0
+
+    @classmethod
+    def create_from_connection_strings(cls, connection_strings: Dict[str, str], **kwargs) -> 'CompactFleet':
+        """
+        Creates a fleet of compact devices. Devices of unknown types are skipped.
+
+        ---
+
+        Args:
+            connection_strings: The devices' connection strings by device id.
+            kwargs: See __init__().
+
+        Returns:
+            A new fleet.
+        """
+        devices = []
+
+        for device_id, connection_string in connection_strings.items():
+            device_type, _, _ = device_id.partition('-')
+            device_class = compact_device_classes.get(device_type)
+
+            if device_class:
+                devices.append(device_class(device_id, connection_string))
+
+        return cls(devices, **kwargs)
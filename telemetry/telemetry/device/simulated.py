@@ -6,23 +6,36 @@ with an Azure IoT Hub.
 
 Functions:
     initiate_shutdown(): Sets the flag 'shutdown_initiated'.
+    create_environment(device_ids, kwargs): Creates the shared greenhouse model for the given devices.
+    info_group(device_id, bed_level): Returns the info group, that the messages of a device are sent with.
 
 Module variables:
     shutdown_initiated: A flag (threading.Event), that can be set to initiate the shutdown of all devices.
-    sleep_timer: All device threads sleep this long each loop or wait at most this long for a command.
+    profiling_method_name: Reserved direct method, that starts the sampling profiler of the whole process.
+    profile_dir: The directory the profiler writes its collapsed stacks to.
+    message_logger: Logs every sent message, attach a filter to sample or rate limit it.
+    environment: The greenhouse model shared by all devices, sensors read from it and controllers change it.
 """
 
 import threading
-import datetime
+import tempfile
 import logging
-import random
 import time
 import json
 
 from azure.iot.device import IoTHubDeviceClient, Message, MethodRequest, MethodResponse
+from telemetry.environment import GreenhouseEnvironment, parse_location
+from telemetry.utils import profiling
+from typing import Iterable
 
 shutdown_initiated = threading.Event()
-sleep_timer = 0.1
+
+profiling_method_name = '_profile'
+profile_dir = tempfile.gettempdir()
+
+message_logger = logging.getLogger(f'{__name__}.messages')
+
+environment: GreenhouseEnvironment = None
 
 
 def initiate_shutdown():
@@ -32,6 +45,61 @@ def initiate_shutdown():
     shutdown_initiated.set()
 
 
+def create_environment(device_ids: Iterable[str], **kwargs) -> GreenhouseEnvironment:
+    """
+    Creates the greenhouse model shared by all devices. It is sized to fit the greenhouses and garden beds of
+    the given devices and has to be created before the devices.
+
+    ---
+
+    Args:
+        device_ids: The ids of all devices, that are going to be simulated.
+        kwargs: See GreenhouseEnvironment.
+
+    Returns:
+        The new environment.
+    """
+    global environment
+
+    locations = []
+
+    for device_id in device_ids:
+        device_type, _, _ = device_id.partition('-')
+        device_class = globals().get(device_type)
+
+        if isinstance(device_class, type) and issubclass(device_class, Device):
+            locations.append(parse_location(device_id, device_class.bed_level))
+
+    environment = GreenhouseEnvironment.create_for_locations(
+        locations, **kwargs)
+
+    return environment
+
+
+def info_group(device_id: str, bed_level: bool) -> str:
+    """
+    Returns the info group of a device, its greenhouse or its garden bed. It is only qualified by the greenhouse, if
+    the id carries a greenhouse number, so the group of a device does not depend on the other devices.
+
+    ---
+
+    Args:
+        device_id: The device's id, e.g. 'SoilSensorsDevice-2' or 'SoilSensorsDevice-2-1'.
+        bed_level: Whether the device belongs to a garden bed.
+
+    Returns:
+        The info group, e.g. 'garden-bed-1' or 'greenhouse-2/garden-bed-1'.
+
+    Raises:
+        ValueError if the id does not match the pattern.
+    """
+    greenhouse, bed = parse_location(device_id, bed_level)
+    group = f'garden-bed-{bed + 1}' if bed_level else 'general-info'
+    qualified = device_id.count('-') == (2 if bed_level else 1)
+
+    return f'greenhouse-{greenhouse + 1}/{group}' if qualified else group
+
+
 class Device(threading.Thread):
     """
     Abstract base class for a simulated device, that can communicate with an
@@ -41,7 +109,7 @@ class Device(threading.Thread):
 
     The device can mock measured sensor data and send it to the hub. Likewise
     it can receive messages from the hub. The device listens for messages in
-    an extra daemonic thread.
+    an extra daemonic thread, which blocks until a message arrives.
 
     ---
 
@@ -49,13 +117,19 @@ class Device(threading.Thread):
         device_id: A string representing the device's id, with which it is registered at the hub.
         connection_string: The connection string, that is used to connect to the hub.
         interval_in_seconds: Frequency, at which to send data.
-        client: An IoTHubDeviceClient, that handles the communication with the hub.
+        last_msg_at: Monotonic time, at which the last message was sent.
+        client: An IoTHubDeviceClient, that handles the communication with the hub. Created on first use.
+        greenhouse: Index of the greenhouse in the environment, the device belongs to.
+        bed: Index of the garden bed in the environment, the device belongs to.
     """
 
+    # whether the device belongs to a single garden bed or to a whole greenhouse
+    bed_level = False
+
     def __init__(self, device_id: str, connection_string: str, interval_in_secs: int = 0):
         """
         Initializes the device's id and it's connection string with the given
-        values and creates the communication client.
+        values. The communication client is created on first use.
 
         ---
 
@@ -72,9 +146,21 @@ class Device(threading.Thread):
         self.device_id = device_id
         self.connection_string = connection_string
         self.interval_in_secs = interval_in_secs
-        self.last_msg_at = datetime.datetime.fromordinal(1)
-        self.client = IoTHubDeviceClient.create_from_connection_string(
-            connection_string)
+        self.last_msg_at = float('-inf')
+        self.greenhouse, self.bed = parse_location(device_id, self.bed_level)
+        self._client = None
+
+    @property
+    def client(self) -> IoTHubDeviceClient:
+        """
+        Returns:
+            The communication client, it is created on first use.
+        """
+        if self._client is None:
+            self._client = IoTHubDeviceClient.create_from_connection_string(
+                self.connection_string)
+
+        return self._client
 
     def run(self):
         """
@@ -83,8 +169,12 @@ class Device(threading.Thread):
         Prints info about starting and stopping of the device to console and
         calls run_loop().
         """
-        # start thread to handle commands from the hub
-        threading.Thread(target=self.recv_command, name=self.name).start()
+        # create the client before both threads use it
+        self.client
+
+        # start thread to handle commands from the hub, it does not need to be stopped on shutdown
+        threading.Thread(target=self.recv_command,
+                         name=self.name, daemon=True).start()
 
         self.logger.info('starting')
         self.run_loop()
@@ -109,47 +199,94 @@ class Device(threading.Thread):
         msg = Message(msg)
         self.client.send_message(msg)
 
-        self.logger.info(msg)
+        # the message is only formatted, if the record is not dropped
+        message_logger.info('%s', msg)
 
     def recv_command(self):
         """
-        Waits for a command from the Azure IoT Hub and calls the desired method,
-        if it exists.
+        Delivers commands from the Azure IoT Hub to handle_method_request().
+        Blocks until a command arrives, so an idle device never wakes up.
         """
-        while self.is_alive():
+        while not shutdown_initiated.is_set():
             method_request: MethodRequest = self.client.receive_method_request(
-                timeout=sleep_timer)
-
-            if method_request:
-                if hasattr(self, method_request.name):
-                    try:
-                        result = getattr(self, method_request.name)(
-                            method_request, **method_request.payload)
-
-                        status = 200
-                        payload = {
-                            'Response': f"Executed direct method '{method_request.name}'.",
-                        }
-
-                        if result:
-                            payload['Result'] = result
-                    except TypeError as err:
-                        status = 400
-                        payload = {
-                            'Response': f"Invalid parameter: {err}."
-                        }
-                else:
-                    status = 404
-                    payload = {
-                        'Response': f"Direct method '{method_request.name}' not defined."
-                    }
-
-                payload['Device'] = self.name
-                payload['Method'] = method_request.name
-
-                response = MethodResponse(
-                    method_request.request_id, status, payload)
-                self.client.send_method_response(response)
+                block=True)
+
+            if method_request and not shutdown_initiated.is_set():
+                self.handle_method_request(method_request)
+
+    def handle_method_request(self, method_request: MethodRequest):
+        """
+        Calls the desired method, if it exists, and sends its response to the
+        Azure IoT Hub.
+
+        ---
+
+        Args:
+            method_request: The direct method request from the hub.
+        """
+        # the SDK delivers requests without payload with None
+        kwargs = method_request.payload or {}
+
+        try:
+            if method_request.name == profiling_method_name:
+                status, payload = self._start_profiling(**kwargs)
+            elif hasattr(self, method_request.name):
+                result = getattr(self, method_request.name)(
+                    method_request, **kwargs)
+
+                status = 200
+                payload = {
+                    'Response': f"Executed direct method '{method_request.name}'.",
+                }
+
+                if result:
+                    payload['Result'] = result
+            else:
+                status = 404
+                payload = {
+                    'Response': f"Direct method '{method_request.name}' not defined."
+                }
+        except TypeError as err:
+            status = 400
+            payload = {
+                'Response': f"Invalid parameter: {err}."
+            }
+
+        payload['Device'] = self.name
+        payload['Method'] = method_request.name
+
+        response = MethodResponse(
+            method_request.request_id, status, payload)
+        self.client.send_method_response(response)
+
+    def _start_profiling(self, duration_in_secs: float = 10):
+        """
+        Starts the sampling profiler for the whole process. The collapsed stacks are written to profile_dir, once
+        the profiler is done.
+
+        ---
+
+        Args:
+            duration_in_secs: Duration in seconds, to profile for.
+
+        Returns:
+            The status and payload of the method response.
+        """
+        try:
+            profiler = profiling.start_profiling(
+                profile_dir, duration_in_secs, prefix='telemetry')
+        except (TypeError, ValueError) as err:
+            return 400, {'Response': f"Invalid parameter: {err}."}
+        except RuntimeError as err:
+            return 409, {'Response': f"Profiling not started: {err}."}
+
+        self.logger.info(
+            f"profiling for {profiler.duration_in_secs} s to '{profiler.output_file}'")
+
+        return 202, {
+            'Response': f"Started profiling for {profiler.duration_in_secs} s.",
+            'Result': {'file': profiler.output_file}
+        }
 
 
 class SensorDevice(Device):
@@ -163,14 +300,17 @@ class SensorDevice(Device):
 
     def run_loop(self):
         """
-        Calls send_data() every interval_in_secs seconds.
+        Calls send_data() every interval_in_secs seconds. Sleeps on the
+        shutdown flag in between, so the shutdown is noticed immediately.
         """
-        while not shutdown_initiated.is_set():
-            if (datetime.datetime.now() - self.last_msg_at).total_seconds() >= self.interval_in_secs:
-                self.send_data()
-                self.last_msg_at = datetime.datetime.now()
+        send_at = time.monotonic()
 
-            time.sleep(sleep_timer)
+        while not shutdown_initiated.wait(timeout=max(0, send_at - time.monotonic())):
+            self.send_data()
+            self.last_msg_at = time.monotonic()
+
+            # do not try to catch up, if sending took longer than the interval
+            send_at = max(send_at + self.interval_in_secs, time.monotonic())
 
     def send_data(self):
         """
@@ -193,8 +333,10 @@ class ControllerDevice(Device):
         super().__init__(device_id, connection_string, interval_in_secs)
 
     def run_loop(self):
-        while not shutdown_initiated.is_set():
-            time.sleep(sleep_timer)
+        """
+        Waits for the shutdown, commands are handled by the receiving thread.
+        """
+        shutdown_initiated.wait()
 
 
 class SoilSensorsDevice(SensorDevice):
@@ -203,9 +345,7 @@ class SoilSensorsDevice(SensorDevice):
     Measures the soil's humidity/moisture and pH.
     """
 
-    # base values for sensor data to mock measurements
-    base_vwc = 32
-    base_pH = 5.4
+    bed_level = True
 
     def get_soil_humidity(self) -> int:
         """
@@ -217,8 +357,8 @@ class SoilSensorsDevice(SensorDevice):
         Returns:
             vwc_in_percent
         """
-        self.base_vwc = self.base_vwc - random.randint(1, 3)
-        return self.base_vwc
+        vwc_in_percent, _ = environment.read_soil(self.greenhouse, self.bed)
+        return round(vwc_in_percent)
 
     def get_soil_pH(self) -> float:
         """
@@ -229,7 +369,8 @@ class SoilSensorsDevice(SensorDevice):
         Returns:
             pH
         """
-        return round(SoilSensorsDevice.base_pH + random.random() * 1.4, 1)
+        _, pH = environment.read_soil(self.greenhouse, self.bed)
+        return round(pH, 1)
 
     def reset_soil_humidity(self, method_request: MethodRequest):
         """
@@ -238,7 +379,7 @@ class SoilSensorsDevice(SensorDevice):
         Args:
             method_request: The direct method request from the hub.
         """
-        self.base_vwc = SoilSensorsDevice.base_vwc + random.randint(0, 5)
+        environment.reset_soil_vwc(self.greenhouse, self.bed)
 
         msg = json.dumps({
             'method_name': method_request.name
@@ -247,13 +388,11 @@ class SoilSensorsDevice(SensorDevice):
         self.logger.info(msg)
 
     def send_data(self):
-        _, _, garden_bed_num = self.device_id.rpartition('-')
-
         vwc_in_percent = self.get_soil_humidity()
         pH = self.get_soil_pH()
 
         msg = json.dumps({
-            'info_group': f'garden-bed-{garden_bed_num}',
+            'info_group': info_group(self.device_id, self.bed_level),
             'measurements': {
                 'vwc_in_percent': vwc_in_percent,
                 'pH': pH
@@ -269,10 +408,6 @@ class AirSensorsDevice(SensorDevice):
     and temperature.
     """
 
-    # base values for sensor data to mock measurements
-    base_humidity = 35
-    base_temperature = 22
-
     def get_relative_air_humidity(self) -> int:
         """
         Gets the reading from the sensor, that measures the relative air
@@ -283,7 +418,9 @@ class AirSensorsDevice(SensorDevice):
         Returns:
             relative_air_humidity_in_percent
         """
-        return self.base_humidity + random.randint(0, 35)
+        relative_air_humidity_in_percent, _ = environment.read_air(
+            self.greenhouse)
+        return round(relative_air_humidity_in_percent)
 
     def get_temperature(self) -> float:
         """
@@ -295,14 +432,15 @@ class AirSensorsDevice(SensorDevice):
         Returns:
             temperature_in_celsius
         """
-        return round(self.base_temperature + random.random() * 10, 1)
+        _, temperature_in_celsius = environment.read_air(self.greenhouse)
+        return round(temperature_in_celsius, 1)
 
     def send_data(self):
         humidity_in_percent = self.get_relative_air_humidity()
         temperature_in_celsius = self.get_temperature()
 
         msg = json.dumps({
-            'info_group': 'general-info',
+            'info_group': info_group(self.device_id, self.bed_level),
             'measurements': {
                 'relative_air_humidity_in_percent': humidity_in_percent,
                 'temperature_in_celsius': temperature_in_celsius
@@ -318,6 +456,8 @@ class IrrigationController(ControllerDevice):
     it receives from the hub.
     """
 
+    bed_level = True
+
     def turn_on(self, method_request: MethodRequest, duration_in_min: int = 0):
         """
         Turns on the irrigation system.
@@ -326,7 +466,8 @@ class IrrigationController(ControllerDevice):
             method_request: The direct method request from the hub.
             duration_in_min: Duration in minutes, to turn on the system.
         """
-        _, _, garden_bed_num = self.device_id.rpartition('-')
+        environment.set_irrigation(
+            self.greenhouse, self.bed, True, duration_in_min)
 
         msg = json.dumps({
             'method_name': method_request.name,
@@ -342,6 +483,8 @@ class IrrigationController(ControllerDevice):
         Args:
             method_request: The direct method request from the hub.
         """
+        environment.set_irrigation(self.greenhouse, self.bed, False)
+
         msg = json.dumps({
             'method_name': method_request.name
         })
@@ -363,6 +506,8 @@ class HeaterController(ControllerDevice):
             method_request: The direct method request from the hub.
             duration_in_min: Duration in minutes, to turn on the heater
         """
+        environment.set_heater(self.greenhouse, True, duration_in_min)
+
         msg = json.dumps({
             'method_name': method_request.name,
             'duration_in_min': duration_in_min
@@ -377,6 +522,8 @@ class HeaterController(ControllerDevice):
         Args:
             method_request: The direct method request from the hub.
         """
+        environment.set_heater(self.greenhouse, False)
+
         msg = json.dumps({
             'method_name': method_request.name
         })
@@ -398,6 +545,8 @@ class WindowController(ControllerDevice):
             method_request: The direct method request from the hub.
             duration_in_min: Duration in minutes, to open the window.
         """
+        environment.set_window(self.greenhouse, True, duration_in_min)
+
         msg = json.dumps({
             'method_name': method_request.name,
             'duration_in_min': duration_in_min
@@ -412,6 +561,8 @@ class WindowController(ControllerDevice):
         Args:
             method_request: The direct method request from the hub.
         """
+        environment.set_window(self.greenhouse, False)
+
         msg = json.dumps({
             'method_name': method_request.name
         })
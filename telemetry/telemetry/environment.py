@@ -0,0 +1,363 @@
+"""
+This module provides a closed-loop physics model of greenhouses, that drives the simulated devices. Controller
+commands change the model's inputs and sensors read from its state.
+
+The state of all greenhouses and garden beds is stored in NumPy arrays and advanced in one vectorized step, so
+the cost of a step hardly depends on the number of beds.
+
+---
+
+Functions:
+    parse_location(device_id, bed_level): Returns the greenhouse and bed index a device belongs to.
+"""
+
+from typing import Iterable, Tuple
+import threading
+import datetime
+import math
+import time
+
+import numpy as np
+
+SECONDS_PER_HOUR = 3600
+SECONDS_PER_DAY = 24 * SECONDS_PER_HOUR
+
+
+def parse_location(device_id: str, bed_level: bool) -> Tuple[int, int]:
+    """
+    Parses the greenhouse and garden bed a device belongs to from its id. Ids look like 'Type[-greenhouse]' for
+    devices of a whole greenhouse and 'Type[-greenhouse]-bed' for devices of a garden bed, numbers start at 1.
+
+    ---
+
+    Args:
+        device_id: The device's id, e.g. 'SoilSensorsDevice-2' or 'HeaterController-3'.
+        bed_level: Whether the device belongs to a garden bed.
+
+    Returns:
+        The zero based indices of greenhouse and garden bed (0 for devices of a whole greenhouse).
+
+    Raises:
+        ValueError if the id does not match the pattern.
+    """
+    _, *numbers = device_id.split('-')
+    numbers = [int(number) for number in numbers]
+
+    if bed_level and len(numbers) <= 2:
+        numbers = [1] * (2 - len(numbers)) + numbers
+    elif not bed_level and len(numbers) <= 1:
+        numbers = [1] * (1 - len(numbers)) + numbers + [1]
+    else:
+        raise ValueError(f"Invalid device id '{device_id}'")
+
+    greenhouse, bed = numbers
+
+    if greenhouse < 1 or bed < 1:
+        raise ValueError(f"Invalid device id '{device_id}'")
+
+    return greenhouse - 1, bed - 1
+
+
+class GreenhouseEnvironment:
+    """
+    A model of several greenhouses with the same number of garden beds each.
+
+    ---
+
+    The model runs on its own clock, which advances time_scale simulated seconds per real second. It is stepped
+    lazily, whenever it is read from or written to and at least step_interval_in_secs real seconds have passed.
+
+    ---
+
+    Attributes:
+        air_temperature: Air temperature of each greenhouse in celsius, shape (greenhouses,).
+        air_humidity: Relative air humidity of each greenhouse in percent, shape (greenhouses,).
+        soil_vwc: Volumetric water content of each bed in percent, shape (greenhouses, beds).
+        soil_pH: pH of each bed, shape (greenhouses, beds).
+        heater_until: Simulated time, until which the heater of a greenhouse is on.
+        window_until: Simulated time, until which the window of a greenhouse is open.
+        irrigation_until: Simulated time, until which the irrigation of a bed is on.
+        clock: The simulated time of day in seconds.
+    """
+
+    # outside weather
+    outside_temperature_mean = 12.0
+    outside_temperature_amplitude = 6.0
+    outside_humidity = 60.0
+
+    # air, rates per hour
+    heater_power = 8.0
+    solar_power = 4.0
+    heat_loss_closed = 0.5
+    heat_loss_open = 3.0
+    humidity_exchange_closed = 0.8
+    humidity_exchange_open = 4.0
+
+    # soil, in percent (vwc) and rates per hour
+    field_capacity = 40.0
+    wilting_point = 5.0
+    saturation = 55.0
+    evapotranspiration = 0.6
+    irrigation_rate = 30.0
+    drainage_rate = 2.0
+    base_vwc = 32.0
+
+    # pH, rates per hour
+    base_pH = 5.4
+    irrigation_water_pH = 7.0
+    pH_recovery_rate = 0.05
+    pH_irrigation_rate = 0.5
+
+    def __init__(self, greenhouses: int = 1, beds: int = 1, time_scale: float = 1.0,
+                 step_interval_in_secs: float = 0.5, seed: int = None):
+        """
+        Initializes the state of all greenhouses and beds.
+
+        ---
+
+        Args:
+            greenhouses: Number of greenhouses.
+            beds: Number of garden beds per greenhouse.
+            time_scale: Simulated seconds per real second.
+            step_interval_in_secs: Minimum real time between two steps.
+            seed: Seed of the random number generator.
+        """
+        self.time_scale = time_scale
+        self.step_interval_in_secs = step_interval_in_secs
+        self.rng = np.random.RandomState(seed)
+
+        now = datetime.datetime.now()
+        self.clock = float(now.hour * SECONDS_PER_HOUR +
+                           now.minute * 60 + now.second)
+
+        self.air_temperature = 20 + self.rng.uniform(0, 4, greenhouses)
+        self.air_humidity = 45 + self.rng.uniform(0, 15, greenhouses)
+        self.soil_vwc = self.base_vwc + \
+            self.rng.uniform(0, 5, (greenhouses, beds))
+        self.base_soil_pH = self.base_pH + \
+            self.rng.uniform(0, 1.4, (greenhouses, beds))
+        self.soil_pH = self.base_soil_pH.copy()
+
+        self.heater_until = np.full(greenhouses, -np.inf)
+        self.window_until = np.full(greenhouses, -np.inf)
+        self.irrigation_until = np.full((greenhouses, beds), -np.inf)
+
+        self._last_step_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """
+        Returns:
+            The number of greenhouses and beds per greenhouse.
+        """
+        return self.soil_vwc.shape
+
+    def step(self, force: bool = False):
+        """
+        Advances all greenhouses and beds to the current time in one vectorized update.
+
+        ---
+
+        Args:
+            force: Step even if less than step_interval_in_secs have passed.
+        """
+        with self._lock:
+            self._step(force)
+
+    def _step(self, force: bool = False):
+        now = time.monotonic()
+        elapsed = now - self._last_step_at
+
+        if elapsed <= 0 or (elapsed < self.step_interval_in_secs and not force):
+            return
+
+        self._last_step_at = now
+        dt = elapsed * self.time_scale
+        hours = dt / SECONDS_PER_HOUR
+
+        # inputs are evaluated at the start of the step
+        heater_on = self.heater_until > self.clock
+        window_open = self.window_until > self.clock
+        irrigation_on = self.irrigation_until > self.clock
+
+        day_phase = 2 * math.pi * (self.clock - 9 * SECONDS_PER_HOUR) / SECONDS_PER_DAY
+        outside_temperature = self.outside_temperature_mean + \
+            self.outside_temperature_amplitude * math.sin(day_phase)
+        solar = self.solar_power * \
+            max(0.0, math.sin(day_phase + math.pi / 4))
+
+        # air temperature relaxes exponentially towards its equilibrium, which is stable for any dt
+        heat_loss = np.where(
+            window_open, self.heat_loss_open, self.heat_loss_closed)
+        equilibrium = outside_temperature + \
+            (heater_on * self.heater_power + solar) / heat_loss
+        self.air_temperature = equilibrium + \
+            (self.air_temperature - equilibrium) * np.exp(-heat_loss * hours)
+        self.air_temperature += self.rng.normal(
+            0, 0.2 * math.sqrt(hours), self.air_temperature.shape)
+
+        # wet soil raises and warm air lowers the relative humidity
+        exchange = np.where(window_open, self.humidity_exchange_open,
+                            self.humidity_exchange_closed)
+        equilibrium = self.outside_humidity + 25 * self.soil_vwc.mean(axis=1) / self.field_capacity \
+            - 1.5 * (self.air_temperature - outside_temperature)
+        self.air_humidity = equilibrium + \
+            (self.air_humidity - equilibrium) * np.exp(-exchange * hours)
+        self.air_humidity += self.rng.normal(
+            0, 0.5 * math.sqrt(hours), self.air_humidity.shape)
+        np.clip(self.air_humidity, 0, 100, out=self.air_humidity)
+
+        # soil dries faster in warm and dry air and drains above field capacity
+        dryness = 2 * (1 - self.air_humidity / 100)
+        warmth = np.maximum(0, 1 + 0.05 * (self.air_temperature - 20))
+        evaporation = self.evapotranspiration * \
+            (dryness * warmth)[:, None] * (self.soil_vwc / self.field_capacity)
+        drainage = self.drainage_rate * \
+            np.maximum(0, self.soil_vwc - self.field_capacity)
+        self.soil_vwc += (irrigation_on * self.irrigation_rate -
+                          evaporation - drainage) * hours
+        np.clip(self.soil_vwc, self.wilting_point,
+                self.saturation, out=self.soil_vwc)
+
+        # pH recovers towards each bed's base and is pulled towards the water's pH while irrigating
+        self.soil_pH = self.base_soil_pH + (self.soil_pH - self.base_soil_pH) * \
+            np.exp(-self.pH_recovery_rate * hours)
+        pull = 1 - np.exp(-self.pH_irrigation_rate * hours)
+        self.soil_pH += irrigation_on * pull * \
+            (self.irrigation_water_pH - self.soil_pH)
+
+        self.clock = (self.clock + dt) % SECONDS_PER_DAY
+        # deadlines are kept relative to the wrapped clock
+        if self.clock < dt:
+            for until in (self.heater_until, self.window_until, self.irrigation_until):
+                until -= SECONDS_PER_DAY
+
+    def read_air(self, greenhouse: int) -> Tuple[float, float]:
+        """
+        Reads the air sensors of a greenhouse.
+
+        ---
+
+        Args:
+            greenhouse: Index of the greenhouse.
+
+        Returns:
+            relative_air_humidity_in_percent, temperature_in_celsius
+        """
+        with self._lock:
+            self._step()
+
+            return (float(self.air_humidity[greenhouse] + self.rng.normal(0, 0.5)),
+                    float(self.air_temperature[greenhouse] + self.rng.normal(0, 0.1)))
+
+    def read_soil(self, greenhouse: int, bed: int) -> Tuple[float, float]:
+        """
+        Reads the soil sensors of a bed.
+
+        ---
+
+        Args:
+            greenhouse: Index of the greenhouse.
+            bed: Index of the bed.
+
+        Returns:
+            vwc_in_percent, pH
+        """
+        with self._lock:
+            self._step()
+
+            return (float(self.soil_vwc[greenhouse, bed] + self.rng.normal(0, 0.3)),
+                    float(self.soil_pH[greenhouse, bed] + self.rng.normal(0, 0.05)))
+
+    def set_heater(self, greenhouse: int, on: bool, duration_in_min: float = 0):
+        """
+        Turns the heater of a greenhouse on or off.
+
+        ---
+
+        Args:
+            greenhouse: Index of the greenhouse.
+            on: Whether to turn the heater on.
+            duration_in_min: Simulated minutes until the heater turns off again, 0 keeps it on.
+        """
+        self._set_until(self.heater_until, greenhouse, on, duration_in_min)
+
+    def set_window(self, greenhouse: int, open: bool, duration_in_min: float = 0):
+        """
+        Opens or closes the window of a greenhouse.
+
+        ---
+
+        Args:
+            greenhouse: Index of the greenhouse.
+            open: Whether to open the window.
+            duration_in_min: Simulated minutes until the window closes again, 0 keeps it open.
+        """
+        self._set_until(self.window_until, greenhouse, open, duration_in_min)
+
+    def set_irrigation(self, greenhouse: int, bed: int, on: bool, duration_in_min: float = 0):
+        """
+        Turns the irrigation of a bed on or off.
+
+        ---
+
+        Args:
+            greenhouse: Index of the greenhouse.
+            bed: Index of the bed.
+            on: Whether to turn the irrigation on.
+            duration_in_min: Simulated minutes until the irrigation turns off again, 0 keeps it on.
+        """
+        self._set_until(self.irrigation_until,
+                        (greenhouse, bed), on, duration_in_min)
+
+    def reset_soil_vwc(self, greenhouse: int, bed: int):
+        """
+        Resets the volumetric water content of a bed to its base value.
+
+        ---
+
+        Args:
+            greenhouse: Index of the greenhouse.
+            bed: Index of the bed.
+        """
+        with self._lock:
+            self._step()
+            self.soil_vwc[greenhouse, bed] = self.base_vwc + \
+                self.rng.uniform(0, 5)
+
+    def _set_until(self, until: np.ndarray, index, on: bool, duration_in_min: float):
+        """
+        Sets the deadline of an input, after stepping the model up to now with the old inputs.
+        """
+        with self._lock:
+            self._step(force=True)
+
+            if not on:
+                until[index] = -np.inf
+            elif duration_in_min > 0:
+                until[index] = self.clock + duration_in_min * 60
+            else:
+                until[index] = np.inf
+
+    @classmethod
+    def create_for_locations(cls, locations: Iterable[Tuple[int, int]], **kwargs) -> 'GreenhouseEnvironment':
+        """
+        Creates an environment, that is large enough for all given locations.
+
+        ---
+
+        Args:
+            locations: The (greenhouse, bed) indices, that have to exist.
+            kwargs: See __init__().
+
+        Returns:
+            A new environment.
+        """
+        greenhouses, beds = 1, 1
+
+        for greenhouse, bed in locations:
+            greenhouses = max(greenhouses, greenhouse + 1)
+            beds = max(beds, bed + 1)
+
+        return cls(greenhouses, beds, **kwargs)
@@ -0,0 +1,196 @@
+"""
+This module implements logging helpers, that keep logging off the hot paths. Records are handed to a bounded
+queue and formatted and written by a dedicated writer thread. The queue and the writer thread are native, even if
+eventlet monkey patched the process, so writing never waits for the green threads to yield. Filters allow to sample
+or rate limit the records of a logger, dropped records are never formatted.
+
+---
+
+Functions:
+    start_queue_logging(logger, handlers, maxsize): Routes the records of a logger through a queue.
+"""
+
+from logging.handlers import QueueHandler, QueueListener
+from typing import Iterable
+import itertools
+import threading
+import logging
+import time
+
+try:
+    # eventlet may monkey patch threading and queue, the writer thread has to be native nevertheless
+    from eventlet import patcher
+
+    _threading = patcher.original('threading')
+    _queue = patcher.original('queue')
+except ImportError:
+    import threading as _threading
+    import queue as _queue
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    A queue handler, that defers formatting to the writer thread and drops records if the queue is full, instead
+    of blocking the caller. Records at or above always_level are never dropped: they wait briefly for the queue and
+    are written by the given handlers in the caller's thread, if it is still full.
+
+    ---
+
+    Attributes:
+        handlers: The handlers, that write records at or above always_level, if the queue stays full.
+        always_level: Records at or above this level are never dropped.
+        block_timeout_in_secs: How long records at or above always_level wait for the queue.
+        dropped: Number of records dropped, because the queue was full.
+    """
+
+    def __init__(self, record_queue: _queue.Queue, handlers: Iterable[logging.Handler] = (),
+                 always_level: int = logging.WARNING, block_timeout_in_secs: float = 0.1):
+        super().__init__(record_queue)
+        self.handlers = list(handlers)
+        self.always_level = always_level
+        self.block_timeout_in_secs = block_timeout_in_secs
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Passes the record on as is. Formatting happens in the writer thread, so arguments of a record should not
+        be mutated after logging them.
+        """
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            return
+        except _queue.Full:
+            if record.levelno < self.always_level:
+                self.dropped += 1
+                return
+
+        try:
+            self.queue.put(record, timeout=self.block_timeout_in_secs)
+        except _queue.Full:
+            # rather write out of order than lose a warning or error
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+
+class NativeQueueListener(QueueListener):
+    """
+    A queue listener, that writes the records in a native thread.
+    """
+
+    def start(self):
+        self._thread = _threading.Thread(target=self._monitor, name='QueueListener', daemon=True)
+        self._thread.start()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    A filter, that only lets every n-th record pass. Records at or above always_level always pass.
+    """
+
+    def __init__(self, n: int, always_level: int = logging.WARNING):
+        """
+        Initializes the filter.
+
+        ---
+
+        Args:
+            n: Let 1 in n records pass.
+            always_level: Records at or above this level are never dropped.
+        """
+        super().__init__()
+
+        if n < 1:
+            raise ValueError('n must be at least 1')
+
+        self.n = n
+        self.always_level = always_level
+        self._counter = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.always_level:
+            return True
+
+        # next() on itertools.count is atomic in CPython, no lock needed
+        return next(self._counter) % self.n == 0
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    A filter, that lets at most rate_per_sec records per second pass, with bursts of up to burst records.
+    Records at or above always_level always pass.
+
+    ---
+
+    Attributes:
+        dropped: Number of records dropped so far.
+    """
+
+    def __init__(self, rate_per_sec: float, burst: int = None, always_level: int = logging.WARNING):
+        """
+        Initializes the filter.
+
+        ---
+
+        Args:
+            rate_per_sec: The sustained number of records per second to let pass.
+            burst: The maximum number of records to let pass at once (default is rate_per_sec).
+            always_level: Records at or above this level are never dropped.
+        """
+        super().__init__()
+
+        self.rate_per_sec = rate_per_sec
+        self.burst = burst if burst is not None else max(1, rate_per_sec)
+        self.always_level = always_level
+        self.dropped = 0
+
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.always_level:
+            return True
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens +
+                               (now - self._last_refill) * self.rate_per_sec)
+            self._last_refill = now
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+
+            self.dropped += 1
+            return False
+
+
+def start_queue_logging(logger: logging.Logger, handlers: Iterable[logging.Handler],
+                        maxsize: int = 10000) -> QueueListener:
+    """
+    Attaches a queue handler to the logger and starts a writer thread, that passes the records on to the given
+    handlers.
+
+    ---
+
+    Args:
+        logger: The logger to attach the queue handler to.
+        handlers: The handlers, that format and write the records.
+        maxsize: Maximum number of queued records, further records below warning level are dropped.
+
+    Returns:
+        The started listener, call stop() on it to flush the queue on shutdown.
+    """
+    handlers = list(handlers)
+    record_queue = _queue.Queue(maxsize)
+    logger.addHandler(DeferredQueueHandler(record_queue, handlers))
+
+    listener = NativeQueueListener(record_queue, *handlers,
+                                   respect_handler_level=True)
+    listener.start()
+
+    return listener
@@ -1,7 +1,8 @@
 import os
+import tempfile
 
 
-def read_connection_string_file(file: str, keyname: str):
+def read_connection_string_file(file: str, keyname: str, policy_name: str = None):
     connection_strings = {}
 
     with open(file) as f:
@@ -11,22 +12,65 @@ def read_connection_string_file(file: str, keyname: str):
             if line.strip().startswith('#'):
                 continue
 
-            for key, _, value in (keyvalue.partition('=') for keyvalue in line.split(';')):
-                if key.lower() == keyname.lower():
-                    connection_strings[value] = line
-                    break
+            keyvalues = {key.lower(): value for key, _, value in (
+                keyvalue.partition('=') for keyvalue in line.split(';'))}
+
+            if policy_name and keyvalues.get('sharedaccesskeyname') != policy_name:
+                continue
+
+            if keyname.lower() in keyvalues:
+                connection_strings[keyvalues[keyname.lower()]] = line
 
     return connection_strings
 
 
+def read_mapping_file(file: str):
+    mapping = {}
+
+    if not os.path.exists(file):
+        return mapping
+
+    with open(file) as f:
+        for line in f.read().splitlines():
+            if not line.strip() or line.strip().startswith('#'):
+                continue
+
+            key, _, value = line.partition('=')
+            mapping[key.strip()] = value.strip()
+
+    return mapping
+
+
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# one line per hub, by the Event Hub's path and the IoT Hub's hostname
 EVENT_HUB_CONNECTION_STRINGS_FILE = os.path.join(
     ROOT_DIR,  'event-hub-connection-strings')
 EVENT_HUB_CONNECTION_STRINGS = read_connection_string_file(
-    EVENT_HUB_CONNECTION_STRINGS_FILE, keyname='SharedAccessKeyName')
+    EVENT_HUB_CONNECTION_STRINGS_FILE, keyname='EntityPath', policy_name='service')
 
 IOT_HUB_CONNECTION_STRINGS_FILE = os.path.join(
     ROOT_DIR, 'iot-hub-connection-strings')
 IOT_HUB_CONNECTION_STRINGS = read_connection_string_file(
-    IOT_HUB_CONNECTION_STRINGS_FILE, keyname='SharedAccessKeyName')
+    IOT_HUB_CONNECTION_STRINGS_FILE, keyname='HostName', policy_name='service')
+
+# explicit 'device_id=hostname' lines written by iot-hub-config.azcli, unlisted devices are routed by consistent hashing
+DEVICE_HUB_MAPPING_FILE = os.path.join(ROOT_DIR, 'device-hub-mapping')
+DEVICE_HUB_MAPPING = read_mapping_file(DEVICE_HUB_MAPPING_FILE)
+
+# direct method calls are throttled to the limits of the IoT Hub's tier
+IOT_HUB_TIER = os.environ.get('SMART_GREENHOUSE_IOT_HUB_TIER', 'F1')
+IOT_HUB_UNITS = int(os.environ.get('SMART_GREENHOUSE_IOT_HUB_UNITS', 1))
+
+DEVICE_IDS_FILE = os.path.join(ROOT_DIR, 'device-ids')
+
+AUTOMATION_RULES_FILE = os.path.join(ROOT_DIR, 'automation-rules.json')
+
+# record the received events to, or replay them from a file instead of connecting to the Event Hub
+RECORD_FILE = os.environ.get('SMART_GREENHOUSE_RECORD_FILE')
+REPLAY_FILE = os.environ.get('SMART_GREENHOUSE_REPLAY_FILE')
+REPLAY_SPEED = float(os.environ.get('SMART_GREENHOUSE_REPLAY_SPEED', 1))
+
+# admin routes are disabled, unless a token is configured
+ADMIN_TOKEN = os.environ.get('SMART_GREENHOUSE_ADMIN_TOKEN')
+PROFILE_DIR = os.environ.get('SMART_GREENHOUSE_PROFILE_DIR', tempfile.gettempdir())
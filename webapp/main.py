@@ -1,14 +1,19 @@
 #!/usr/bin/env python
 
+# patch before anything creates threads or locks, e.g. the direct method schedulers in webapp.routes, so they are
+# green threads, that may emit on the socket like with gunicorn's eventlet worker
+import eventlet
+eventlet.monkey_patch()
+
 from webapp import app
-from webapp.routes import socketio
-from definitions import EVENT_HUB_CONNECTION_STRINGS
-from webapp.utils.azure import SimpleMessageReceiver
+from webapp.routes import socketio, rules_engine, statistics_collector, emit_measurement_summaries, \
+    warn_about_unknown_info_groups
+from definitions import EVENT_HUB_CONNECTION_STRINGS, RECORD_FILE, REPLAY_FILE, REPLAY_SPEED
+from webapp.utils.azure import SimpleMessageReceiver, EventRecorder, EventReplayer
+from webapp.utils.log import start_queue_logging, SamplingFilter
 import threading
+import atexit
 import logging
-import eventlet
-
-eventlet.monkey_patch()
 
 app_name = 'webapp'
 threading.current_thread().setName(app_name)
@@ -20,11 +25,42 @@ sh_formatter = logging.Formatter(
     fmt='[{asctime}] [{levelname:^8}]: <{threadName}>: {message}',
     style='{')
 sh.setFormatter(sh_formatter)
-logger.addHandler(sh)
+log_listener = start_queue_logging(logger, [sh])
+atexit.register(log_listener.stop)
+
+# log 1 in 10 messages, warnings and errors are always logged
+logging.getLogger('webapp.utils.azure.event.messages').addFilter(
+    SamplingFilter(10))
+
+warn_about_unknown_info_groups()
+
+if REPLAY_FILE:
+    # feed the recording into an unconnected receiver
+    simple_message_receiver = SimpleMessageReceiver(
+        None, socketio=socketio, listeners=[rules_engine, statistics_collector])
+    event_replayer = EventReplayer(
+        REPLAY_FILE, simple_message_receiver, speed=REPLAY_SPEED, daemon=True)
+    event_replayer.start()
+else:
+    event_recorder = EventRecorder(RECORD_FILE) if RECORD_FILE else None
+
+    if event_recorder:
+        atexit.register(event_recorder.close)
+
+    # one receiver per hub, all of them feed the same listeners. With several hubs, the info groups are qualified by
+    # the Event Hub's path, which is the IoT Hub's name for the built-in endpoint, as in the device registry
+    simple_message_receivers = []
+    multiple_hubs = len(EVENT_HUB_CONNECTION_STRINGS) > 1
+
+    for event_hub_path, connection_string in EVENT_HUB_CONNECTION_STRINGS.items():
+        simple_message_receiver = SimpleMessageReceiver(
+            connection_string, handler_name=f'MessageReceiver-{event_hub_path}' if multiple_hubs else 'MessageReceiver',
+            socketio=socketio, listeners=[rules_engine, statistics_collector], recorder=event_recorder,
+            partition_prefix=f'{event_hub_path}/' if multiple_hubs else '', daemon=True)
+        simple_message_receiver.start()
+        simple_message_receivers.append(simple_message_receiver)
 
-simple_message_receiver = SimpleMessageReceiver(
-    EVENT_HUB_CONNECTION_STRINGS['service'], socketio=socketio, daemon=True)
-simple_message_receiver.start()
+socketio.start_background_task(emit_measurement_summaries)
 
 
 if __name__ == "__main__":
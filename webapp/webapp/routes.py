@@ -1,14 +1,112 @@
 from . import app
-from flask import render_template
+from flask import render_template, request, abort, send_file, url_for, jsonify
 from flask_socketio import SocketIO
-from definitions import IOT_HUB_CONNECTION_STRINGS
-from webapp.utils.azure import SimpleDirectMethodHandler
+from concurrent.futures import Future
+from definitions import IOT_HUB_CONNECTION_STRINGS, IOT_HUB_TIER, IOT_HUB_UNITS, DEVICE_HUB_MAPPING, ADMIN_TOKEN, \
+    PROFILE_DIR, AUTOMATION_RULES_FILE, DEVICE_IDS_FILE
+from webapp.utils.azure import SimpleDirectMethodHandler, DirectMethodScheduler, HubRouter, hub_name
+from webapp.utils.azure.scheduler import INTERACTIVE, AUTOMATED
+from webapp.utils.azure import event
+from webapp.utils.automation import Rule, RulesEngine, load_rules
+from webapp.utils.registry import DeviceRegistry, CONTROLLER_METHODS
+from webapp.utils.rollingstats import StatisticsCollector
+from webapp.utils.assets import AssetManifest
+from webapp.utils import profiling
+from typing import Any, Callable
+import logging
+import hmac
+
+logger = logging.getLogger(__name__)
 
 async_mode = 'eventlet'
 socketio = SocketIO(app, async_mode=async_mode)
 
-simple_direct_method_handler = SimpleDirectMethodHandler.create_from_connection_string(
-    IOT_HUB_CONNECTION_STRINGS['service'])
+# one handler and scheduler per hub, each hub is throttled on its own
+direct_method_schedulers = HubRouter({
+    hostname: DirectMethodScheduler.create_for_tier(
+        SimpleDirectMethodHandler.create_from_connection_string(connection_string), IOT_HUB_TIER, IOT_HUB_UNITS)
+    for hostname, connection_string in IOT_HUB_CONNECTION_STRINGS.items()
+}, DEVICE_HUB_MAPPING)
+
+
+def emit_direct_method_response(future: Future):
+    """
+    Emits the response of a scheduled direct method to all clients. Called by the scheduler's workers, which have
+    to be green threads, as the socket does not support emitting from native threads.
+    """
+    if not future.cancelled() and future.exception() is None:
+        socketio.emit('direct_method_response', future.result())
+
+
+def direct_method_succeeded(future: Future) -> bool:
+    """
+    Returns:
+        True if the scheduled direct method was executed by the device, else False.
+    """
+    if future.cancelled() or future.exception() is not None:
+        return False
+
+    status = future.result().get('status') if isinstance(future.result(), dict) else None
+    return isinstance(status, int) and 200 <= status < 300
+
+
+def invoke_rule(rule: Rule, completed: Callable[[bool], Any]):
+    """
+    Schedules the direct method of a fired rule, below the calls of the dashboard.
+    """
+    scheduler = direct_method_schedulers.route(rule.device_id)
+    future = scheduler.submit(rule.device_id, rule.method_name, priority=AUTOMATED,
+                              arguments=dict(rule.arguments))
+    future.add_done_callback(emit_direct_method_response)
+    future.add_done_callback(lambda future: completed(direct_method_succeeded(future)))
+
+
+automation_rules = load_rules(AUTOMATION_RULES_FILE)
+rules_engine = RulesEngine(invoke_rule, automation_rules)
+
+statistics_collector = StatisticsCollector()
+summary_interval_in_secs = 10
+
+
+def emit_measurement_summaries():
+    """
+    Emits the rolling statistics of all measurements every summary_interval_in_secs seconds, until the shutdown
+    of the message receivers is initiated.
+    """
+    while not event.shutdown_initiated.is_set():
+        socketio.sleep(summary_interval_in_secs)
+        socketio.emit('measurements_summary', statistics_collector.summaries())
+
+
+def device_hub_name(device_id: str) -> str:
+    """
+    Returns:
+        The name of the hub, the device is registered at.
+    """
+    return hub_name(direct_method_schedulers.hub_for(device_id))
+
+
+# with several hubs the info groups are qualified by the hub, like the message receivers do it
+device_registry = DeviceRegistry(
+    DEVICE_IDS_FILE, hub_for=device_hub_name if len(IOT_HUB_CONNECTION_STRINGS) > 1 else None)
+
+
+def warn_about_unknown_info_groups():
+    """
+    Logs a warning for each automation rule, whose info group no registered device sends, e.g. after renaming the
+    device ids, as such a rule never fires.
+    """
+    info_groups = {info_group.id for info_group in device_registry.info_groups}
+
+    for rule in automation_rules:
+        if rule.info_group not in info_groups:
+            logger.warning(f"{rule} references the info group '{rule.info_group}', that no registered device sends")
+
+
+asset_manifest = AssetManifest(app.static_folder)
+
+# rendered dashboards by registry version
+rendered_pages = {}
 
 contact_info = {
     'name': 'John Doe',
@@ -22,16 +120,112 @@ def inject_contact_info():
     return {'title': 'Smart Greenhouse', 'smart_greenhouse_contact_info': contact_info}
 
 
+@app.context_processor
+def inject_asset_url():
+    def asset_url(filename: str) -> str:
+        return url_for('asset', digest=asset_manifest.assets[filename].digest, filename=filename)
+
+    return {'asset_url': asset_url}
+
+
+@app.route('/assets/<digest>/<path:filename>')
+def asset(digest: str, filename: str):
+    """
+    Serves a precompressed static asset. Its URL contains the content hash, so it can be cached forever.
+    """
+    found = asset_manifest.lookup(
+        digest, filename, request.headers.get('Accept-Encoding', ''))
+
+    if found is None:
+        abort(404)
+
+    asset, encoding, content = found
+    response = app.response_class(content, mimetype=asset.mimetype)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(f'{asset.digest}-{encoding}')
+
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+
+    return response.make_conditional(request)
+
+
 @app.route('/')
 def index():
-    return render_template('index.html', page_title='Smart Greenhouse')
+    device_registry.refresh()
+    version = device_registry.version
+
+    if version not in rendered_pages:
+        rendered_pages.clear()
+        rendered_pages[version] = render_template(
+            'index.html', page_title='Smart Greenhouse', greenhouses=device_registry.greenhouses)
+
+    return rendered_pages[version]
+
+
+def require_admin():
+    """
+    Aborts the request, unless it carries the configured admin token as bearer token. Admin routes do not exist,
+    if no token is configured.
+    """
+    if not ADMIN_TOKEN:
+        abort(404)
+
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        abort(401)
+
+
+@app.route('/admin/profile', methods=['POST'])
+def admin_profile():
+    """
+    Profiles the webapp for 'duration_in_secs' seconds (default 10) and returns the collapsed stacks of all
+    threads and greenlets.
+    """
+    require_admin()
+
+    try:
+        profiler = profiling.start_profiling(
+            PROFILE_DIR, request.args.get('duration_in_secs', 10), prefix='webapp')
+    except ValueError as err:
+        abort(400, str(err))
+    except RuntimeError as err:
+        abort(409, str(err))
+
+    # only yield to other greenlets, the profiler runs in a native thread
+    while profiler.is_running():
+        socketio.sleep(0.1)
+
+    return send_file(profiler.output_file, mimetype='text/plain', as_attachment=True)
+
+
+@app.route('/admin/direct-methods/metrics')
+def admin_direct_method_metrics():
+    """
+    Returns the queue metrics of the direct method schedulers by hub.
+    """
+    require_admin()
+
+    return jsonify({hostname: scheduler.metrics() for hostname, scheduler in direct_method_schedulers.items()})
 
 
 @socketio.on('direct_method_event')
 def direct_method_event(message):
-    url = message.get('url', '')
+    device_id = message.get('device_id', '')
     method_name = message.get('method_name', '')
     arguments = message.get('arguments', {})
 
-    socketio.start_background_task(target=socketio.emit(
-        'direct_method_response', simple_direct_method_handler.invoke_direct_method(url=url, method_name=method_name, arguments=arguments)))
+    # only the controller methods of devices from the registry are relayed, not reserved methods like '_profile'
+    if device_id not in device_registry.device_ids or not isinstance(arguments, dict):
+        return
+
+    device_type, _, _ = device_id.partition('-')
+
+    if method_name not in CONTROLLER_METHODS.get(device_type, ()):
+        return
+
+    scheduler = direct_method_schedulers.route(device_id)
+    scheduler.submit(device_id, method_name, priority=INTERACTIVE,
+                     arguments=arguments).add_done_callback(emit_direct_method_response)
@@ -1,38 +1,53 @@
 document.addEventListener('DOMContentLoaded', function () {
     var socket = io();
 
-    socket.on('measurements_update', function (msg, cb) {
-        info_group = document.getElementById(msg.info_group);
+    // map measurement keys and controllers to their DOM nodes once, instead of searching on every update
+    var measurements = new Map();
+    var controllers = new Map();
+
+    document.querySelectorAll('[data-measurement]').forEach((node) => {
+        measurements.set(node.dataset.measurement, node);
+    });
+
+    document.querySelectorAll('[data-controller]').forEach((node) => {
+        controllers.set(node.dataset.controller, node);
+    });
 
+    socket.on('measurements_update', function (msg, cb) {
         for (var measurement in msg.measurements) {
-            info_group.querySelector(`[id^=${measurement}]`).innerText = msg.measurements[measurement];
+            let node = measurements.get(`${msg.info_group}/${measurement}`);
+
+            if (node) {
+                node.textContent = msg.measurements[measurement];
+            }
+        }
+    });
+
+    // show the statistics of the last minute as tooltip
+    socket.on('measurements_summary', function (msg, cb) {
+        for (var info_group in msg) {
+            for (var measurement in msg[info_group]) {
+                let node = measurements.get(`${info_group}/${measurement}`);
+                let summary = msg[info_group][measurement]['1m'];
+
+                if (node && summary && summary.count) {
+                    node.title = `last minute: min ${summary.min.toFixed(1)}, max ${summary.max.toFixed(1)}, ` +
+                        `mean ${summary.mean.toFixed(1)}, stddev ${summary.stddev.toFixed(2)}, p90 ${summary.p90.toFixed(1)}`;
+                }
+            }
         }
     });
 
     // TODO needs cleaning, right now only works for controller devices, to show what's possible
     socket.on('direct_method_response', function (msg, cb) {
-        controller = msg.payload.Device;
+        let node = msg.payload && controllers.get(msg.payload.Device);
 
-        if (msg.status == 200 && controller.includes('Controller')) {
-            status = '';
+        if (msg.status == 200 && node) {
+            let status = '';
 
             switch (msg.payload.Method) {
                 case 'turn_on':
                     status = 'on';
-
-                    // simulate irrigation
-                    if (controller.startsWith('IrrigationController')) {
-                        split = controller.split('-');
-                        num = split[split.length - 1];
-                        url = `https://smart-greenhouse-iot-hub.azure-devices.net/twins/SoilSensorsDevice-${num}/methods?api-version=2018-06-30`;
-
-                        socket.emit('direct_method_event', {
-                            url: url,
-                            method_name: 'reset_soil_humidity',
-                            arguments: {}
-                        });
-                    }
-
                     break;
                 case 'turn_off':
                     status = 'off';
@@ -45,18 +60,16 @@ document.addEventListener('DOMContentLoaded', function () {
                     break;
             }
 
-            document.getElementById(controller).innerText = status;
+            node.textContent = status;
         }
     });
 
     // TODO needs cleaning, right now just to show what's possible
-    document.querySelectorAll('[id*=Controller]').forEach((controller) => {
-        let url = `https://smart-greenhouse-iot-hub.azure-devices.net/twins/${controller.id}/methods?api-version=2018-06-30`
-
+    controllers.forEach((controller, device_id) => {
         controller.addEventListener('click', function (event) {
             let method_name = '';
 
-            switch (controller.innerHTML) {
+            switch (controller.textContent) {
                 case 'off':
                     method_name = 'turn_on';
                     break;
@@ -70,11 +83,11 @@ document.addEventListener('DOMContentLoaded', function () {
                     method_name = 'open';
                     break;
                 default:
-                    method_name = controller.id === 'WindowController' ? 'open' : 'turn_on';
+                    method_name = device_id.startsWith('WindowController') ? 'open' : 'turn_on';
             }
 
             socket.emit('direct_method_event', {
-                url: url,
+                device_id: device_id,
                 method_name: method_name,
                 arguments: {}
             });
@@ -0,0 +1,201 @@
+"""
+This module implements a manifest of precompressed, content hashed static assets. All assets are read and
+compressed once on startup, so they can be served straight from memory with long-lived cache headers.
+
+Brotli compression is used, if the optional brotli package is installed.
+"""
+
+from typing import Dict, NamedTuple, Optional, Tuple
+import mimetypes
+import posixpath
+import hashlib
+import gzip
+import io
+import re
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+compressible_extensions = {'.css', '.js', '.svg', '.html', '.json', '.txt'}
+
+css_url_pattern = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+class Asset(NamedTuple):
+    """
+    A static asset with its precompressed encodings.
+    """
+    digest: str
+    mimetype: str
+    encodings: Dict[str, bytes]
+
+
+class AssetManifest:
+    """
+    A manifest of all assets in a static folder.
+
+    ---
+
+    Attributes:
+        static_folder: The folder the assets were read from.
+        url_prefix: The URL path, the assets are served under.
+        assets: The assets by their path relative to the static folder.
+    """
+
+    def __init__(self, static_folder: str, url_prefix: str = '/assets'):
+        """
+        Reads, hashes and compresses all assets in the static folder. References in stylesheets are rewritten to
+        the hashed URLs of the referenced assets.
+
+        ---
+
+        Args:
+            static_folder: The folder to read the assets from.
+            url_prefix: The URL path, the assets are served under.
+        """
+        self.static_folder = static_folder
+        self.url_prefix = url_prefix.rstrip('/')
+        self.assets: Dict[str, Asset] = {}
+
+        stylesheets = []
+
+        for root, _, files in os.walk(static_folder):
+            for name in files:
+                path = os.path.relpath(os.path.join(
+                    root, name), static_folder).replace(os.sep, '/')
+
+                if path.endswith('.css'):
+                    stylesheets.append(path)
+                else:
+                    self._add(path, self._read(path))
+
+        # stylesheets are added last, so the assets they reference are already hashed
+        for path in stylesheets:
+            self._add(path, self._rewrite_css_urls(path, self._read(path)))
+
+    def url_for(self, path: str) -> str:
+        """
+        Returns:
+            The content hashed URL of the asset.
+
+        Raises:
+            KeyError if the asset does not exist.
+        """
+        return f'{self.url_prefix}/{self.assets[path].digest}/{path}'
+
+    def lookup(self, digest: str, path: str, accept_encoding: str) -> Optional[Tuple[Asset, str, bytes]]:
+        """
+        Looks up an asset and picks the best encoding the client accepts.
+
+        ---
+
+        Args:
+            digest: The content hash from the URL.
+            path: The asset's path from the URL.
+            accept_encoding: The client's Accept-Encoding header.
+
+        Returns:
+            The asset, the chosen encoding ('identity' if uncompressed) and its content, or None if there is no
+            asset with that path and digest.
+        """
+        asset = self.assets.get(path)
+
+        if asset is None or asset.digest != digest:
+            return None
+
+        qvalues = _parse_accept_encoding(accept_encoding)
+
+        # the highest q-value wins, on ties brotli before gzip, encodings with q=0 are refused
+        candidates = [(qvalues.get(encoding, qvalues.get('*', 0.0)), -rank, encoding)
+                      for rank, encoding in enumerate(('br', 'gzip')) if encoding in asset.encodings]
+        candidates = [candidate for candidate in candidates if candidate[0] > 0]
+
+        if candidates:
+            _, _, encoding = max(candidates)
+            return asset, encoding, asset.encodings[encoding]
+
+        return asset, 'identity', asset.encodings['identity']
+
+    def _read(self, path: str) -> bytes:
+        with open(os.path.join(self.static_folder, path), 'rb') as f:
+            return f.read()
+
+    def _add(self, path: str, content: bytes):
+        """
+        Hashes and compresses an asset. Compressed encodings are only kept, if they are smaller.
+        """
+        encodings = {'identity': content}
+
+        if os.path.splitext(path)[1] in compressible_extensions:
+            compressed = {'gzip': _gzip(content)}
+
+            if brotli is not None:
+                compressed['br'] = brotli.compress(content)
+
+            encodings.update((encoding, data) for encoding, data in compressed.items()
+                             if len(data) < len(content))
+
+        mimetype, _ = mimetypes.guess_type(path)
+        self.assets[path] = Asset(hashlib.sha256(content).hexdigest()[:12],
+                                  mimetype or 'application/octet-stream', encodings)
+
+    def _rewrite_css_urls(self, path: str, content: bytes) -> bytes:
+        """
+        Replaces relative url() references in a stylesheet with the hashed URLs of the referenced assets.
+        """
+        base = posixpath.dirname(path)
+
+        def replace(match):
+            url = match.group(2)
+            referenced = posixpath.normpath(posixpath.join(base, url))
+
+            if referenced in self.assets:
+                return f"url('{self.url_for(referenced)}')"
+
+            return match.group(0)
+
+        return css_url_pattern.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+
+def _parse_accept_encoding(accept_encoding: str) -> Dict[str, float]:
+    """
+    Parses an Accept-Encoding header into the q-value of each listed encoding, e.g. 'gzip;q=0.5, br' into
+    {'gzip': 0.5, 'br': 1.0}. Malformed q-values count as 0.
+    """
+    qvalues = {}
+
+    for item in accept_encoding.lower().split(','):
+        encoding, *params = [part.strip() for part in item.split(';')]
+
+        if not encoding:
+            continue
+
+        qvalue = 1.0
+
+        for param in params:
+            name, _, value = param.partition('=')
+
+            if name.strip() == 'q':
+                try:
+                    qvalue = min(max(float(value), 0.0), 1.0)
+                except ValueError:
+                    qvalue = 0.0
+
+        qvalues[encoding] = qvalue
+
+    return qvalues
+
+
+def _gzip(content: bytes) -> bytes:
+    """
+    Compresses with gzip, without a timestamp in the header, so the output is reproducible.
+    """
+    buffer = io.BytesIO()
+
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9, mtime=0) as f:
+        f.write(content)
+
+    return buffer.getvalue()
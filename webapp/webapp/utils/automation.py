@@ -0,0 +1,225 @@
+"""
+This module implements a server-side automation rules engine. It is fed with the measurements received from the
+Event Hub and invokes direct methods, when a rule's condition is met.
+
+Rules are indexed by (info_group, measurement), so each reading only evaluates the rules referencing it.
+
+---
+
+Functions:
+    load_rules(file): Loads rules from a JSON file.
+"""
+
+from typing import Any, Callable, Dict, List, Mapping, Tuple
+from webapp.utils.rollingstats import is_reading
+import functools
+import operator
+import threading
+import logging
+import json
+import time
+import os
+
+operators = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+class Rule:
+    """
+    A rule like 'if vwc_in_percent in garden-bed-1 < 20 then turn_on IrrigationController-1 for 10 min'.
+
+    ---
+
+    After firing the rule is disarmed, until the value has crossed back over the threshold by at least hysteresis.
+    If its direct method fails, the rule is re-armed right away, as the value cannot recover without it. A dose, like
+    irrigating for some minutes, may not recover the value either, so the rule is also re-armed, if its condition
+    still holds after cooldown_in_secs. Independently it does not fire again within cooldown_in_secs, which also limits
+    the retries of a failing direct method.
+
+    ---
+
+    Attributes:
+        info_group: The info group of the measurement, e.g. 'garden-bed-1'.
+        measurement: The measurement to check, e.g. 'vwc_in_percent'.
+        operator: One of '<', '<=', '>', '>='.
+        threshold: The value to compare the measurement with.
+        device_id: The device, on which to invoke the direct method.
+        method_name: The direct method to invoke.
+        arguments: The payload for the direct method.
+        hysteresis: Distance to the threshold, the value has to recover by, before the rule fires again.
+        cooldown_in_secs: Minimum time between firing twice.
+        armed: Whether the rule can fire.
+        last_fired_at: Monotonic time of the last firing.
+    """
+
+    def __init__(self, info_group: str, measurement: str, operator: str, threshold: float, device_id: str,
+                 method_name: str, arguments: Mapping[str, Any] = None, hysteresis: float = 0,
+                 cooldown_in_secs: float = 0):
+        if operator not in operators:
+            raise ValueError(f"Invalid operator '{operator}'")
+
+        self.info_group = info_group
+        self.measurement = measurement
+        self.operator = operator
+        self.threshold = threshold
+        self.device_id = device_id
+        self.method_name = method_name
+        self.arguments = dict(arguments or {})
+        self.hysteresis = hysteresis
+        self.cooldown_in_secs = cooldown_in_secs
+
+        self.armed = True
+        self.last_fired_at = float('-inf')
+
+        self._compare = operators[operator]
+
+        # value, that re-arms the rule, lies on the other side of the threshold
+        if operator.startswith('<'):
+            self._rearm = lambda value: value >= threshold + hysteresis
+        else:
+            self._rearm = lambda value: value <= threshold - hysteresis
+
+    def evaluate(self, value: float, now: float) -> bool:
+        """
+        Updates the rule's state with a new reading.
+
+        ---
+
+        Args:
+            value: The measured value.
+            now: The current monotonic time.
+
+        Returns:
+            True if the rule fires, else False.
+        """
+        if not self.armed:
+            self.armed = self._rearm(value) or \
+                now - self.last_fired_at >= self.cooldown_in_secs and self._compare(value, self.threshold)
+
+            if not self.armed:
+                return False
+
+        if self._compare(value, self.threshold) and now - self.last_fired_at >= self.cooldown_in_secs:
+            self.armed = False
+            self.last_fired_at = now
+            return True
+
+        return False
+
+    def __repr__(self) -> str:
+        return (f"Rule(if {self.measurement} in {self.info_group} {self.operator} {self.threshold} "
+                f"then {self.method_name} {self.device_id} {self.arguments})")
+
+
+class RulesEngine:
+    """
+    Evaluates rules against incoming measurements. An instance can be added as listener to a
+    SimpleMessageReceiver.
+    """
+
+    def __init__(self, invoke: Callable[[Rule, Callable[[bool], Any]], Any], rules: List[Rule] = ()):
+        """
+        Initializes the engine.
+
+        ---
+
+        Args:
+            invoke: Called with each rule, that fires, and a callback, that has to be called with whether the rule's
+                direct method succeeded, once it has completed. Should not block, as it is called on the receive path.
+            rules: The initial rules.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.NOTSET)
+
+        self.invoke = invoke
+
+        self._index: Dict[Tuple[str, str], List[Rule]] = {}
+        self._lock = threading.Lock()
+
+        for rule in rules:
+            self.add_rule(rule)
+
+    def add_rule(self, rule: Rule):
+        """
+        Adds a rule to the engine.
+        """
+        with self._lock:
+            self._index.setdefault(
+                (rule.info_group, rule.measurement), []).append(rule)
+
+    def remove_rule(self, rule: Rule):
+        """
+        Removes a rule from the engine.
+        """
+        with self._lock:
+            key = (rule.info_group, rule.measurement)
+            self._index[key].remove(rule)
+
+            if not self._index[key]:
+                del self._index[key]
+
+    def __call__(self, info_group: str, measurements: Mapping[str, Any]):
+        """
+        Evaluates the rules referencing the given measurements and invokes those, that fire.
+
+        ---
+
+        Args:
+            info_group: The info group of the measurements.
+            measurements: The measured values by name.
+        """
+        now = time.monotonic()
+        fired = []
+
+        with self._lock:
+            for measurement, value in measurements.items():
+                rules = self._index.get((info_group, measurement))
+
+                if not rules or not is_reading(value):
+                    continue
+
+                fired.extend(rule for rule in rules if rule.evaluate(value, now))
+
+        for rule in fired:
+            self.logger.info(f'fired {rule}')
+
+            try:
+                self.invoke(rule, functools.partial(self._completed, rule))
+            except Exception:
+                self.logger.exception(f'failed to invoke {rule}')
+                self._completed(rule, False)
+
+    def _completed(self, rule: Rule, succeeded: bool):
+        """
+        Re-arms a rule, if its direct method failed.
+        """
+        if succeeded:
+            return
+
+        with self._lock:
+            rule.armed = True
+
+        self.logger.warning(f're-armed {rule}, its direct method failed')
+
+
+def load_rules(file: str) -> List[Rule]:
+    """
+    Loads rules from a JSON file, containing a list of objects with the arguments of Rule.
+
+    ---
+
+    Args:
+        file: The file to load the rules from.
+
+    Returns:
+        The loaded rules, an empty list if the file does not exist.
+    """
+    if not os.path.exists(file):
+        return []
+
+    with open(file) as f:
+        return [Rule(**rule) for rule in json.load(f)]
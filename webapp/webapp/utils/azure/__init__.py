@@ -1,4 +1,8 @@
 from .directmethod import SimpleDirectMethodHandler
 from .event import SimpleMessageReceiver
+from .recording import EventRecorder, EventReplayer
+from .scheduler import DirectMethodScheduler
+from .sharding import HubRouter, hub_name
 
-__all__ = ['SimpleDirectMethodHandler', 'SimpleMessageReceiver']
+__all__ = ['SimpleDirectMethodHandler', 'SimpleMessageReceiver', 'EventRecorder', 'EventReplayer',
+           'DirectMethodScheduler', 'HubRouter', 'hub_name']
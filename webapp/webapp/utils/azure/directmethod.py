@@ -25,6 +25,9 @@ class SimpleDirectMethodHandler:
         https://github.com/Azure/azure-iot-sdk-python/tree/v1-deprecated (v1 and its limitations)
     """
 
+    # added to the response timeout, to give up on a hung connection
+    http_timeout_margin_in_secs = 5
+
     def __init__(self, connection_string: str):
         """
         Initializes the DirectMethodHandler based on the IoT Hub connection string.
@@ -39,6 +42,17 @@ class SimpleDirectMethodHandler:
         self._current_sas_token = self._generate_sas_token(
             self._token_hostname, self._token_key, self._policy_name)
 
+        # reuse connections to the hub across invocations
+        self._session = requests.Session()
+
+    @property
+    def hostname(self) -> str:
+        """
+        Returns:
+            The hostname of the IoT Hub.
+        """
+        return self._token_hostname
+
     def invoke_direct_method(self, url: str, method_name: str, response_timeout_in_secs: int = 30,
                              arguments: Mapping[str, any] = {}, **kwargs: Mapping[str, any]) -> str:
         """
@@ -73,9 +87,34 @@ class SimpleDirectMethodHandler:
             'payload': arguments
         }
 
-        req = requests.post(url=url, data=json.dumps(data), headers=headers)
+        # the hub answers within the response timeout, the margin covers the connection and transfer
+        req = self._session.post(url=url, data=json.dumps(data), headers=headers,
+                                 timeout=response_timeout_in_secs + self.http_timeout_margin_in_secs)
         return json.loads(req.text)
 
+    def invoke_device_method(self, device_id: str, method_name: str, **kwargs: Mapping[str, any]) -> str:
+        """
+        Invokes a direct method on a device registered at this handler's IoT Hub.
+
+        ---
+
+        Args:
+            device_id: The id of the device.
+            method_name: The method to invoke on the device.
+            kwargs: See invoke_direct_method().
+
+        Returns:
+            The invocation response.
+        """
+        return self.invoke_direct_method(url=self.device_method_url(device_id), method_name=method_name, **kwargs)
+
+    def device_method_url(self, device_id: str) -> str:
+        """
+        Returns:
+            The request URI for direct methods of the given device.
+        """
+        return f'https://{self._token_hostname}/twins/{parse.quote(device_id)}/methods?api-version=2018-06-30'
+
     def _generate_sas_token(self, uri: str, key: str, policy_name: str, ttl_in_secs: int = 3600):
         """
         Generates a new SAS token.
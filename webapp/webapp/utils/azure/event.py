@@ -9,16 +9,21 @@ Functions:
 Module variables:
     shutdown_initiated: A flag (threading.Event), that can be set to initiate the shutdown of all handlers.
     sleep_timer: All handlers sleep this long each loop or wait at most this long for a command.
+    message_logger: Logs every received event, attach a filter to sample or rate limit it.
 """
 
 from azure.eventhub import EventHubClient, EventPosition, EventData, EventHubConsumer
-from typing import List, Mapping, Any
+from typing import Callable, List, Mapping, Any
 import threading
 import logging
+import json
+import time
 
 shutdown_initiated = threading.Event()
 sleep_timer = 0.1
 
+message_logger = logging.getLogger(f'{__name__}.messages')
+
 
 def initiate_shutdown():
     """
@@ -30,7 +35,14 @@ def initiate_shutdown():
 class SimpleMessageReceiver(threading.Thread):
     """
     A simple class to receive messages sent to an Azure Even Hub. If a flask-socketio is given it emits a new
-    measurements_update event over that socket.
+    measurements_update event over that socket. Listeners are called with the info group and measurements of
+    each message. If a recorder is given, each received event is recorded.
+
+    Without connection string the receiver does not connect to a hub, but events can still be fed to
+    handle_event(), e.g. by an EventReplayer.
+
+    If the partition ids are prefixed by the hub, like 'hub-2/0', the info groups are qualified alike, e.g.
+    'hub-2/garden-bed-1', so the readings of several hubs can be told apart.
     """
 
     def __init__(self, connection_string: str, handler_name: str = 'MessageReceiver', **kwargs: Mapping[str, Any]):
@@ -40,10 +52,14 @@ class SimpleMessageReceiver(threading.Thread):
         ---
 
         Args:
-            connection_string: The connection string for the EventHub you wish to connect to.
+            connection_string: The connection string for the EventHub you wish to connect to, or None.
             handler_name: Name of the handler.
             kwargs: of note:
                 socketio: The socketio to use in conjunction with flask-socketio.
+                listeners: Callables, that are called with info_group and measurements of each message.
+                recorder: An EventRecorder, that records each received event.
+                partition_prefix: Prefixed to the partition ids and info groups, to tell several hubs apart, e.g.
+                    'hub-2/'.
                 For further possibilities see threading.Thread.
         """
         super().__init__(name=handler_name, kwargs=kwargs)
@@ -52,15 +68,21 @@ class SimpleMessageReceiver(threading.Thread):
         self.logger.setLevel(logging.NOTSET)
 
         self.socketio = kwargs.get('socketio', None)
+        self.listeners = list(kwargs.get('listeners', []))
+        self.recorder = kwargs.get('recorder', None)
+        self.partition_prefix = kwargs.get('partition_prefix', '')
+
+        self.consumer = []
+        self.running_consumers = []
+
+        if connection_string is None:
+            return
 
         self.event_hub_client = EventHubClient.from_connection_string(
             connection_string)
 
         partition_ids = self.event_hub_client.get_partition_ids()
 
-        self.consumer = []
-        self.running_consumers = []
-
         for partition_id in partition_ids:
             self.consumer.append(self.event_hub_client.create_consumer(
                 '$default', partition_id, EventPosition("@latest", True)))
@@ -88,24 +110,74 @@ class SimpleMessageReceiver(threading.Thread):
             events: List[EventData] = consumer.receive(timeout=sleep_timer)
 
             for event in events:
-                self.logger.info(
-                    f'[Partition {consumer._partition:>{2}}]: {event.message}')
-
-                # if a socketio is given, emit a new event
-                if self.socketio:
-                    try:
-                        msg = event.body_as_json()
-
-                        self.socketio.emit('measurements_update', {
-                            'info_group': msg['info_group'],
-                            'measurements': msg['measurements']
-                        })
-                    except TypeError:
-                        # TODO filter some 'hello' messages from Azure?
-                        pass
+                enqueued_time = event.enqueued_time
+                self.handle_event(f'{self.partition_prefix}{consumer._partition}', event.sequence_number,
+                                  enqueued_time.timestamp() if enqueued_time else time.time(),
+                                  event.body_as_str().encode('utf-8'))
 
         consumer.close()
 
+    def handle_event(self, partition_id: str, sequence_number: int, enqueued_time: float, body: bytes):
+        """
+        Handles a single event, received live or replayed.
+
+        ---
+
+        Args:
+            partition_id: The partition the event was received from.
+            sequence_number: The event's sequence number within its partition.
+            enqueued_time: The time the event was enqueued, as POSIX timestamp.
+            body: The event's raw body.
+        """
+        if self.recorder:
+            self.recorder.record(partition_id, sequence_number, enqueued_time, body)
+
+        # the event is only formatted, if the record is not dropped
+        message_logger.info('[Partition %2s]: %s', partition_id, body)
+
+        try:
+            msg = json.loads(body)
+            info_group = msg['info_group']
+            measurements = msg['measurements']
+        except (TypeError, KeyError, ValueError):
+            # TODO filter some 'hello' messages from Azure?
+            return
+
+        if not isinstance(measurements, Mapping):
+            return
+
+        # recorded partition ids keep the hub, so replayed events are qualified as well
+        hub, _, _ = partition_id.rpartition('/')
+
+        if hub:
+            info_group = f'{hub}/{info_group}'
+
+        # if a socketio is given, emit a new event
+        if self.socketio:
+            self.socketio.emit('measurements_update', {
+                'info_group': info_group,
+                'measurements': measurements
+            })
+
+        # a failing listener must neither stop the others nor the partition's consumer
+        for listener in self.listeners:
+            try:
+                listener(info_group, measurements)
+            except Exception:
+                self.logger.exception(f'listener {listener!r} failed on {info_group}')
+
+    def add_listener(self, listener: Callable[[str, Mapping[str, Any]], Any]):
+        """
+        Adds a listener, that is called with info_group and measurements of each received message. Listeners are
+        called on the receive path, so they should not block.
+
+        ---
+
+        Args:
+            listener: The callable to add.
+        """
+        self.listeners.append(listener)
+
     @classmethod
     def from_connection_string(cls, connection_string: str) -> 'SimpleMessageReceiver':
         """
@@ -0,0 +1,269 @@
+"""
+This module implements recording and replaying of the events received from an Azure Event Hub.
+
+A recording is a compact, append-only binary file. It starts with a magic header, followed by one record per
+event: a fixed size header (partition id length, body length, sequence number, enqueue time as POSIX timestamp)
+and the partition id and body bytes. A truncated last record, e.g. after a crash, is ignored when reading and cut
+off, before further events are appended.
+
+---
+
+Functions:
+    read_recording(file): Yields the recorded events of a file.
+"""
+
+from typing import Iterator, NamedTuple
+from .event import SimpleMessageReceiver, shutdown_initiated
+import threading
+import logging
+import struct
+import time
+import os
+
+MAGIC = b'SGEVREC1'
+RECORD_HEADER = struct.Struct('<HIqd')
+
+
+class RecordedEvent(NamedTuple):
+    """
+    A single recorded event.
+    """
+    partition_id: str
+    sequence_number: int
+    enqueued_time: float
+    body: bytes
+
+
+class EventRecorder:
+    """
+    Appends received events to a recording. Can be shared by several consumer threads.
+    """
+
+    def __init__(self, file: str, flush_interval_in_secs: float = 1.0):
+        """
+        Opens the recording for appending, writing the header if the file is new.
+
+        ---
+
+        Args:
+            file: The file to append to.
+            flush_interval_in_secs: Records are flushed at most this long after they were recorded, also when no
+                further events arrive.
+        """
+        self.file = file
+        self.flush_interval_in_secs = flush_interval_in_secs
+
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.NOTSET)
+
+        # appending after a truncated record would misalign all further records
+        if os.path.exists(file):
+            length = _recorded_length(file)
+
+            if length < os.path.getsize(file):
+                self.logger.warning(f"cut off a truncated record at the end of '{file}'")
+                os.truncate(file, length)
+
+        self._f = open(file, 'ab')
+        self._lock = threading.Lock()
+
+        # flushes the buffered records, while there are any
+        self._flush_timer: threading.Timer = None
+
+        if self._f.tell() == 0:
+            self._f.write(MAGIC)
+
+    def record(self, partition_id: str, sequence_number: int, enqueued_time: float, body: bytes):
+        """
+        Appends an event to the recording.
+
+        ---
+
+        Args:
+            partition_id: The partition the event was received from.
+            sequence_number: The event's sequence number within its partition.
+            enqueued_time: The time the event was enqueued, as POSIX timestamp.
+            body: The event's raw body.
+        """
+        partition = partition_id.encode('utf-8')
+        header = RECORD_HEADER.pack(
+            len(partition), len(body), sequence_number, enqueued_time)
+
+        with self._lock:
+            self._f.write(header + partition + body)
+
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(
+                    self.flush_interval_in_secs, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush(self):
+        """
+        Flushes the buffered records.
+        """
+        with self._lock:
+            self._flush_timer = None
+
+            if not self._f.closed:
+                self._f.flush()
+
+    def close(self):
+        """
+        Flushes and closes the recording.
+        """
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+
+            self._f.close()
+
+
+def _recorded_length(file: str) -> int:
+    """
+    Returns the length of a recording up to the end of its last complete record.
+
+    ---
+
+    Args:
+        file: The recording to check.
+
+    Returns:
+        The length in bytes, 0 if not even the magic header is complete.
+
+    Raises:
+        ValueError if the file is not a recording.
+    """
+    size = os.path.getsize(file)
+
+    with open(file, 'rb') as f:
+        magic = f.read(len(MAGIC))
+
+        if not MAGIC.startswith(magic):
+            raise ValueError(f"'{file}' is not an event recording")
+
+        if len(magic) < len(MAGIC):
+            return 0
+
+        end = len(MAGIC)
+
+        while True:
+            header = f.read(RECORD_HEADER.size)
+
+            if len(header) < RECORD_HEADER.size:
+                return end
+
+            partition_len, body_len, _, _ = RECORD_HEADER.unpack(header)
+            record_end = end + RECORD_HEADER.size + partition_len + body_len
+
+            if record_end > size:
+                return end
+
+            end = record_end
+            f.seek(end)
+
+
+def read_recording(file: str) -> Iterator[RecordedEvent]:
+    """
+    Yields the events of a recording in the order they were recorded.
+
+    ---
+
+    Args:
+        file: The recording to read.
+
+    Returns:
+        An iterator over the recorded events.
+
+    Raises:
+        ValueError if the file is not a recording or is corrupt.
+    """
+    with open(file, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"'{file}' is not an event recording")
+
+        while True:
+            header = f.read(RECORD_HEADER.size)
+
+            if len(header) < RECORD_HEADER.size:
+                return
+
+            partition_len, body_len, sequence_number, enqueued_time = RECORD_HEADER.unpack(
+                header)
+            data = f.read(partition_len + body_len)
+
+            if len(data) < partition_len + body_len:
+                return
+
+            try:
+                partition_id = data[:partition_len].decode('utf-8')
+            except UnicodeDecodeError:
+                raise ValueError(f"'{file}' is corrupt, invalid partition id") from None
+
+            yield RecordedEvent(partition_id, sequence_number, enqueued_time, data[partition_len:])
+
+
+class EventReplayer(threading.Thread):
+    """
+    Feeds a recording into the receive path of a SimpleMessageReceiver, as if the events were received live.
+
+    ---
+
+    Events are replayed in the order they were recorded, which keeps the order within each partition. Their
+    pacing follows the enqueue times, divided by speed.
+    """
+
+    def __init__(self, file: str, receiver: SimpleMessageReceiver, speed: float = 1.0,
+                 handler_name: str = 'EventReplayer', **kwargs):
+        """
+        Initializes the replayer.
+
+        ---
+
+        Args:
+            file: The recording to replay.
+            receiver: The receiver to feed the events to, usually created without connection string.
+            speed: Replay speed relative to the recorded one, 0 replays as fast as possible.
+            handler_name: Name of the handler.
+            kwargs: See threading.Thread.
+        """
+        super().__init__(name=handler_name, **kwargs)
+
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.NOTSET)
+
+        self.file = file
+        self.receiver = receiver
+        self.speed = speed
+        self.replayed = 0
+
+    def run(self):
+        """
+        Replays the recording until it is exhausted or the shutdown is initiated.
+        """
+        self.logger.info(f"replaying '{self.file}' at speed {self.speed or 'max'}")
+
+        started_at = time.monotonic()
+        first_enqueued_time = None
+
+        for event in read_recording(self.file):
+            if shutdown_initiated.is_set():
+                break
+
+            if self.speed > 0:
+                if first_enqueued_time is None:
+                    first_enqueued_time = event.enqueued_time
+
+                delay = started_at + (event.enqueued_time -
+                                      first_enqueued_time) / self.speed - time.monotonic()
+
+                if delay > 0 and shutdown_initiated.wait(delay):
+                    break
+
+            self.receiver.handle_event(
+                event.partition_id, event.sequence_number, event.enqueued_time, event.body)
+            self.replayed += 1
+
+        self.logger.info(
+            f'replayed {self.replayed} events in {time.monotonic() - started_at:.3f} s')
@@ -0,0 +1,351 @@
+"""
+This module implements a client-side scheduler for direct method invocations. It keeps the calls within the IoT
+Hub's throttling limits with a token bucket, runs interactive calls before automated and bulk calls and never runs
+two calls to the same device at once.
+
+---
+
+Module variables:
+    INTERACTIVE, AUTOMATED, BULK: The priority classes, from highest to lowest.
+    hub_tier_calls_per_sec: Direct method calls per second and unit, for each IoT Hub tier.
+"""
+
+from concurrent.futures import Future
+from typing import Any, Dict, List, Mapping, Set, Tuple
+from .directmethod import SimpleDirectMethodHandler
+import itertools
+import threading
+import logging
+import heapq
+import time
+
+INTERACTIVE = 0
+AUTOMATED = 1
+BULK = 2
+
+priority_names = {INTERACTIVE: 'interactive',
+                  AUTOMATED: 'automated', BULK: 'bulk'}
+
+# direct methods are throttled by traffic in 4 KB chunks: 160 KB/s (F1, S1), 480 KB/s (S2) and 24 MB/s (S3) per unit
+hub_tier_calls_per_sec = {'F1': 40, 'S1': 40, 'S2': 120, 'S3': 6000}
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket, that refills rate_per_sec tokens per second up to capacity.
+    """
+
+    def __init__(self, rate_per_sec: float, capacity: float = None):
+        """
+        Initializes a full bucket.
+
+        ---
+
+        Args:
+            rate_per_sec: Tokens added per second.
+            capacity: Maximum number of tokens (default is rate_per_sec).
+        """
+        self.rate_per_sec = rate_per_sec
+        self.capacity = capacity if capacity is not None else max(
+            1, rate_per_sec)
+
+        self._tokens = float(self.capacity)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Takes a token, possibly in advance.
+
+        ---
+
+        Returns:
+            The time in seconds, the caller has to wait until the token is actually available.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens +
+                               (now - self._last_refill) * self.rate_per_sec)
+            self._last_refill = now
+            self._tokens -= 1
+
+            return max(0.0, -self._tokens / self.rate_per_sec)
+
+    def refund(self):
+        """
+        Returns a reserved token, that was not used.
+        """
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+
+class _Job:
+    """
+    A queued direct method invocation.
+    """
+
+    def __init__(self, priority: int, seq: int, device_id: str, method_name: str, kwargs: Mapping[str, Any]):
+        self.priority = priority
+        self.seq = seq
+        self.device_id = device_id
+        self.method_name = method_name
+        self.kwargs = kwargs
+        self.future = Future()
+        self.queued_at = time.monotonic()
+
+    def __lt__(self, other: '_Job') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class DirectMethodScheduler:
+    """
+    Schedules direct method invocations on a SimpleDirectMethodHandler.
+
+    ---
+
+    Calls are queued per device and ordered by priority, then by submission. Worker threads take a token from the
+    bucket first and only then pick the best queued call, so a call submitted while the hub is saturated still
+    overtakes calls of lower priority. Calls to a device wait until its previous call has completed.
+
+    Calls can take as long as their response timeout, so some workers are reserved for interactive calls. Calls of
+    lower priority never occupy them, so interactive calls do not wait for slow automated or bulk calls.
+    """
+
+    def __init__(self, handler: SimpleDirectMethodHandler, rate_per_sec: float, burst: float = None,
+                 workers: int = 4, reserved_workers: int = 1):
+        """
+        Initializes the scheduler and starts its worker threads.
+
+        ---
+
+        Args:
+            handler: The handler to invoke the direct methods with.
+            rate_per_sec: Maximum sustained calls per second.
+            burst: Maximum calls at once (default is rate_per_sec).
+            workers: Maximum number of calls in flight.
+            reserved_workers: Number of workers, that only run interactive calls.
+
+        Raises:
+            ValueError if no worker is left for calls of lower priority.
+        """
+        if not 0 <= reserved_workers < workers:
+            raise ValueError('reserved_workers must leave at least one of the workers')
+
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.NOTSET)
+
+        self.handler = handler
+        self.bucket = TokenBucket(rate_per_sec, burst)
+        self.max_lower_priority_calls = workers - reserved_workers
+
+        self._seq = itertools.count()
+        self._device_queues: Dict[str, List[_Job]] = {}
+        self._ready: List[Tuple[int, int, str]] = []
+        self._busy_devices: Set[str] = set()
+        self._lower_priority_calls = 0
+        self._queued = 0
+        self._condition = threading.Condition()
+        self._shutdown = False
+
+        self._metrics = {priority: {'submitted': 0, 'started': 0, 'queue_time_total_in_secs': 0.0,
+                                    'queue_time_max_in_secs': 0.0}
+                         for priority in priority_names}
+
+        self._workers = [threading.Thread(target=self._work, name=f'DirectMethodScheduler-{i}', daemon=True)
+                         for i in range(workers)]
+
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, device_id: str, method_name: str, priority: int = INTERACTIVE,
+               **kwargs: Mapping[str, Any]) -> Future:
+        """
+        Queues a direct method invocation.
+
+        ---
+
+        Args:
+            device_id: The id of the device.
+            method_name: The method to invoke on the device.
+            priority: One of INTERACTIVE, AUTOMATED or BULK.
+            kwargs: See SimpleDirectMethodHandler.invoke_direct_method().
+
+        Returns:
+            A future, that resolves to the invocation response.
+        """
+        if priority not in priority_names:
+            raise ValueError(f"Invalid priority '{priority}'")
+
+        job = _Job(priority, next(self._seq), device_id, method_name, kwargs)
+
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError('scheduler is shut down')
+
+            heapq.heappush(self._device_queues.setdefault(device_id, []), job)
+            self._metrics[priority]['submitted'] += 1
+            self._queued += 1
+
+            if device_id not in self._busy_devices:
+                heapq.heappush(self._ready, (job.priority, job.seq, device_id))
+
+            self._condition.notify()
+
+        return job.future
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Returns:
+            The number of queued calls and per priority class the number of submitted and started calls and
+            the mean and maximum queue time.
+        """
+        with self._condition:
+            by_priority = {}
+
+            for priority, metrics in self._metrics.items():
+                by_priority[priority_names[priority]] = dict(
+                    metrics, queue_time_mean_in_secs=metrics['queue_time_total_in_secs'] / metrics['started']
+                    if metrics['started'] else 0.0)
+
+            return {'queued': self._queued, 'priorities': by_priority}
+
+    def shutdown(self):
+        """
+        Stops the workers after their current call. Queued calls are cancelled.
+        """
+        with self._condition:
+            self._shutdown = True
+
+            for queue in self._device_queues.values():
+                for job in queue:
+                    job.future.cancel()
+
+            self._device_queues.clear()
+            self._ready.clear()
+            self._queued = 0
+            self._condition.notify_all()
+
+    def _work(self):
+        """
+        Invokes queued calls, one at a time.
+        """
+        while True:
+            with self._condition:
+                while not self._shutdown and self._peek_ready() is None:
+                    self._condition.wait()
+
+                if self._shutdown:
+                    return
+
+            time.sleep(self.bucket.reserve())
+
+            with self._condition:
+                job = self._pop_ready()
+
+                if job is None:
+                    # another worker took the call meanwhile
+                    self.bucket.refund()
+                    continue
+
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    job.future.set_result(self.handler.invoke_device_method(
+                        job.device_id, job.method_name, **job.kwargs))
+            except Exception as err:
+                self.logger.warning(
+                    f"direct method '{job.method_name}' on '{job.device_id}' failed: {err}")
+                job.future.set_exception(err)
+            finally:
+                self._complete(job)
+
+    def _peek_ready(self) -> _Job:
+        """
+        Returns the best queued call, that can be started, without taking it. Calls of lower priority than
+        INTERACTIVE can not be started, while they occupy all unreserved workers. Expects the condition to be held.
+        """
+        while self._ready:
+            priority, seq, device_id = self._ready[0]
+            queue = self._device_queues.get(device_id)
+
+            # drop stale entries, the device is busy or its best call has changed
+            if device_id in self._busy_devices or not queue or queue[0].seq != seq:
+                heapq.heappop(self._ready)
+                continue
+
+            # the heap is ordered by priority, so no call behind it can be started either
+            if priority != INTERACTIVE and self._lower_priority_calls >= self.max_lower_priority_calls:
+                return None
+
+            return queue[0]
+
+        return None
+
+    def _pop_ready(self) -> _Job:
+        """
+        Takes the best queued call of a device, that has no call in flight and can be started. Expects the condition
+        to be held.
+        """
+        if self._peek_ready() is None:
+            return None
+
+        _, _, device_id = heapq.heappop(self._ready)
+        job = heapq.heappop(self._device_queues[device_id])
+        self._busy_devices.add(device_id)
+        self._queued -= 1
+
+        if job.priority != INTERACTIVE:
+            self._lower_priority_calls += 1
+
+        queue_time = time.monotonic() - job.queued_at
+        metrics = self._metrics[job.priority]
+        metrics['started'] += 1
+        metrics['queue_time_total_in_secs'] += queue_time
+        metrics['queue_time_max_in_secs'] = max(
+            metrics['queue_time_max_in_secs'], queue_time)
+
+        return job
+
+    def _complete(self, job: _Job):
+        """
+        Releases the device of a finished call and makes its next call ready.
+        """
+        with self._condition:
+            self._busy_devices.discard(job.device_id)
+            queue = self._device_queues.get(job.device_id)
+
+            # a call of lower priority may wait for this worker
+            if job.priority != INTERACTIVE:
+                self._lower_priority_calls -= 1
+                self._condition.notify()
+
+            if queue:
+                heapq.heappush(
+                    self._ready, (queue[0].priority, queue[0].seq, job.device_id))
+                self._condition.notify()
+            elif queue is not None:
+                del self._device_queues[job.device_id]
+
+    @classmethod
+    def create_for_tier(cls, handler: SimpleDirectMethodHandler, tier: str, units: int = 1,
+                        **kwargs: Mapping[str, Any]) -> 'DirectMethodScheduler':
+        """
+        Creates a scheduler, that matches the direct method throttle of an IoT Hub tier.
+
+        ---
+
+        Args:
+            handler: The handler to invoke the direct methods with.
+            tier: The IoT Hub's tier, e.g. 'S1'.
+            units: The number of units of the IoT Hub.
+            kwargs: See __init__().
+
+        Returns:
+            A new scheduler.
+
+        Raises:
+            ValueError if the tier is unknown.
+        """
+        if tier.upper() not in hub_tier_calls_per_sec:
+            raise ValueError(f"Unknown IoT Hub tier '{tier}'")
+
+        return cls(handler, hub_tier_calls_per_sec[tier.upper()] * units, **kwargs)
@@ -0,0 +1,115 @@
+"""
+This module implements routing of devices to the IoT Hub they are registered at, when devices are spread over
+several hubs. Devices are routed by an explicit mapping or else by consistent hashing of their id, so adding a hub
+only moves a small share of the devices.
+"""
+
+from typing import Dict, Generic, Iterator, List, Mapping, Tuple, TypeVar
+import hashlib
+import bisect
+
+T = TypeVar('T')
+
+
+def hub_name(hostname: str) -> str:
+    """
+    Returns the name of an IoT Hub, which is also the path of its built-in Event Hub endpoint.
+
+    ---
+
+    Args:
+        hostname: The IoT Hub's hostname, e.g. 'smart-greenhouse-iot-hub.azure-devices.net'.
+
+    Returns:
+        The hub's name, e.g. 'smart-greenhouse-iot-hub'.
+    """
+    name, _, _ = hostname.partition('.')
+    return name
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class ConsistentHashRing:
+    """
+    A consistent hash ring, that places each node at several points to spread the keys evenly.
+    """
+
+    def __init__(self, nodes: List[str], replicas: int = 100):
+        """
+        Initializes the ring.
+
+        ---
+
+        Args:
+            nodes: The nodes to place on the ring.
+            replicas: The number of points per node.
+        """
+        if not nodes:
+            raise ValueError('a ring needs at least one node')
+
+        points = sorted((_hash(f'{node}#{replica}'), node)
+                        for node in nodes for replica in range(replicas))
+
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: str) -> str:
+        """
+        Returns:
+            The node, that owns the key.
+        """
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+class HubRouter(Generic[T]):
+    """
+    Routes devices to a per hub object, e.g. a direct method scheduler.
+    """
+
+    def __init__(self, hubs: Mapping[str, T], mapping: Mapping[str, str] = None, replicas: int = 100):
+        """
+        Initializes the router.
+
+        ---
+
+        Args:
+            hubs: The per hub objects by the hubs' hostnames.
+            mapping: Explicit hub hostnames by device id, devices not in it are routed by consistent hashing.
+            replicas: The number of points per hub on the hash ring.
+
+        Raises:
+            ValueError if there are no hubs or the mapping references an unknown hub.
+        """
+        self.hubs: Dict[str, T] = dict(hubs)
+        self.mapping: Dict[str, str] = dict(mapping or {})
+
+        unknown_hubs = set(self.mapping.values()) - set(self.hubs)
+
+        if unknown_hubs:
+            raise ValueError(f'unknown hubs in mapping: {sorted(unknown_hubs)}')
+
+        self._ring = ConsistentHashRing(sorted(self.hubs), replicas)
+
+    def hub_for(self, device_id: str) -> str:
+        """
+        Returns:
+            The hostname of the hub, that owns the device.
+        """
+        return self.mapping.get(device_id) or self._ring.node_for(device_id)
+
+    def route(self, device_id: str) -> T:
+        """
+        Returns:
+            The object of the hub, that owns the device.
+        """
+        return self.hubs[self.hub_for(device_id)]
+
+    def items(self) -> Iterator[Tuple[str, T]]:
+        """
+        Returns:
+            The hubs' hostnames and objects.
+        """
+        return iter(self.hubs.items())
@@ -0,0 +1,241 @@
+"""
+This module implements an opt-in sampling profiler. While it is switched off nothing is hooked into the
+interpreter and no thread is running, so it costs nothing.
+
+Once started, a native thread periodically samples the stacks of all threads (and of all suspended greenlets,
+if greenlet is installed) for the given duration. The result is written in the collapsed stack format, which can
+be turned into a flamegraph with e.g. flamegraph.pl or speedscope.
+
+---
+
+Functions:
+    start_profiling(output_dir, duration_in_secs, prefix): Starts the process wide profiler.
+    active_profiler(): Returns the currently running profiler or None.
+"""
+
+from collections import Counter
+from typing import Dict, List, Optional
+import weakref
+import sys
+import os
+import gc
+
+try:
+    # eventlet may monkey patch threading and time, the sampler has to run in a native thread nevertheless
+    from eventlet import patcher
+
+    _threading = patcher.original('threading')
+    _time = patcher.original('time')
+except ImportError:
+    import threading as _threading
+    import time as _time
+
+try:
+    import greenlet
+except ImportError:
+    greenlet = None
+
+import threading
+
+max_duration_in_secs = 300
+
+_lock = _threading.Lock()
+_active_profiler: Optional['SamplingProfiler'] = None
+
+
+class SamplingProfiler:
+    """
+    A sampling profiler, that writes collapsed stacks of all threads and greenlets to a file.
+    """
+
+    def __init__(self, output_file: str, duration_in_secs: float, interval_in_secs: float = 0.005,
+                 include_greenlets: bool = True):
+        """
+        Initializes the profiler.
+
+        ---
+
+        Args:
+            output_file: The file to write the collapsed stacks to.
+            duration_in_secs: Duration in seconds, to sample for.
+            interval_in_secs: Time between two samples.
+            include_greenlets: Whether to sample suspended greenlets as well.
+        """
+        self.output_file = output_file
+        self.duration_in_secs = duration_in_secs
+        self.interval_in_secs = interval_in_secs
+        self.include_greenlets = include_greenlets and greenlet is not None
+
+        self.samples = Counter()
+        self._greenlets: List[weakref.ref] = []
+        self._greenlets_refreshed_at = 0.0
+        self._thread = None
+        self._finished = _threading.Event()
+
+    def start(self):
+        """
+        Starts sampling in a native daemonic thread.
+        """
+        self._thread = _threading.Thread(
+            target=self._run, name='SamplingProfiler', daemon=True)
+        self._thread.start()
+
+    def is_running(self) -> bool:
+        """
+        Returns:
+            True if the profiler has not yet written its result, else False.
+        """
+        return not self._finished.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Blocks until the profiler has written its result. Do not call this from a greenlet, use is_running()
+        instead.
+
+        ---
+
+        Args:
+            timeout: Maximum time to wait in seconds.
+
+        Returns:
+            True if the profiler is done, else False.
+        """
+        return self._finished.wait(timeout)
+
+    def _run(self):
+        """
+        Samples until the duration is over and writes the result.
+        """
+        global _active_profiler
+
+        own_ident = _threading.get_ident()
+        deadline = _time.monotonic() + self.duration_in_secs
+
+        try:
+            while _time.monotonic() < deadline:
+                self._sample(own_ident)
+                _time.sleep(self.interval_in_secs)
+
+            self._write()
+        finally:
+            with _lock:
+                _active_profiler = None
+
+            self._finished.set()
+
+    def _sample(self, own_ident: int):
+        """
+        Takes a single sample of all stacks.
+        """
+        thread_names = self._thread_names()
+
+        for ident, frame in sys._current_frames().items():
+            if ident != own_ident:
+                self._add_stack(thread_names.get(ident, f'thread-{ident}'), frame)
+
+        if self.include_greenlets:
+            for greenlet_ref in self._suspended_greenlets():
+                gr = greenlet_ref()
+
+                # the running greenlet of each thread has no frame, it is covered by sys._current_frames()
+                if gr is not None and gr.gr_frame is not None:
+                    self._add_stack(f'greenlet-{id(gr):x}', gr.gr_frame)
+
+    def _add_stack(self, root: str, frame):
+        """
+        Adds the stack ending in frame to the samples.
+        """
+        stack = []
+
+        while frame is not None:
+            code = frame.f_code
+            stack.append(
+                f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+
+        stack.append(root)
+        stack.reverse()
+
+        self.samples[';'.join(label.replace(';', ',') for label in stack)] += 1
+
+    def _thread_names(self) -> Dict[int, str]:
+        """
+        Returns:
+            The names of all known threads by their ident.
+        """
+        names = {}
+
+        for module in {threading, _threading}:
+            for thread in module.enumerate():
+                if thread.ident is not None:
+                    names.setdefault(thread.ident, thread.name)
+
+        return names
+
+    def _suspended_greenlets(self) -> List[weakref.ref]:
+        """
+        Returns weak references to all greenlets. Scanning the heap is expensive, so the list is only refreshed
+        once per second.
+        """
+        now = _time.monotonic()
+
+        if now - self._greenlets_refreshed_at >= 1:
+            self._greenlets = [weakref.ref(obj) for obj in gc.get_objects()
+                               if isinstance(obj, greenlet.greenlet)]
+            self._greenlets_refreshed_at = now
+
+        return self._greenlets
+
+    def _write(self):
+        """
+        Writes the collected samples in the collapsed stack format.
+        """
+        with open(self.output_file, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def start_profiling(output_dir: str, duration_in_secs: float, prefix: str = 'profile') -> SamplingProfiler:
+    """
+    Starts the process wide sampling profiler. Only one profiler can run at a time.
+
+    ---
+
+    Args:
+        output_dir: The directory to write the collapsed stacks to.
+        duration_in_secs: Duration in seconds, to sample for.
+        prefix: Prefix of the output file's name.
+
+    Returns:
+        The started profiler.
+
+    Raises:
+        ValueError if the duration is not within (0, max_duration_in_secs].
+        RuntimeError if a profiler is already running.
+    """
+    global _active_profiler
+
+    duration_in_secs = float(duration_in_secs)
+
+    if not 0 < duration_in_secs <= max_duration_in_secs:
+        raise ValueError(
+            f'duration_in_secs must be within (0, {max_duration_in_secs}]')
+
+    with _lock:
+        if _active_profiler is not None:
+            raise RuntimeError('a profiler is already running')
+
+        output_file = os.path.join(
+            output_dir, f'{prefix}-{os.getpid()}-{int(_time.time())}.folded')
+        _active_profiler = SamplingProfiler(output_file, duration_in_secs)
+        _active_profiler.start()
+
+        return _active_profiler
+
+
+def active_profiler() -> Optional[SamplingProfiler]:
+    """
+    Returns:
+        The currently running profiler or None.
+    """
+    return _active_profiler
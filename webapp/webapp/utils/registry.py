@@ -0,0 +1,215 @@
+"""
+This module implements a registry of the devices shown on the dashboard. The devices are read from a file with one
+device id per line, the dashboard's layout is derived from their types and locations.
+
+Ids look like 'Type[-greenhouse]' for devices of a whole greenhouse and 'Type[-greenhouse]-bed' for devices of a
+garden bed, like the ids of the simulated devices. The info groups of ids, that carry a greenhouse number, are
+qualified by the greenhouse, e.g. 'greenhouse-2/garden-bed-1', as the devices do it. If the devices are spread over
+several hubs, the info groups are additionally qualified by the hub, e.g. 'hub-2/garden-bed-1', as the message
+receivers do it.
+"""
+
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import threading
+import hashlib
+import os
+
+# measurements sent by each sensor device type as (key, label, unit)
+SENSOR_MEASUREMENTS = {
+    'AirSensorsDevice': [('relative_air_humidity_in_percent', 'Humidity', '%'),
+                         ('temperature_in_celsius', 'Temperature', '°C')],
+    'SoilSensorsDevice': [('vwc_in_percent', 'VWC', '%'),
+                          ('pH', 'pH', '')],
+}
+
+CONTROLLER_LABELS = {
+    'HeaterController': 'Heater',
+    'WindowController': 'Window',
+    'IrrigationController': 'Irrigation',
+}
+
+# direct methods, the dashboard may invoke on each controller device type
+CONTROLLER_METHODS = {
+    'HeaterController': {'turn_on', 'turn_off'},
+    'WindowController': {'open', 'close'},
+    'IrrigationController': {'turn_on', 'turn_off'},
+}
+
+# device types, that belong to a single garden bed
+BED_DEVICE_TYPES = {'SoilSensorsDevice', 'IrrigationController'}
+
+
+class InfoGroup(NamedTuple):
+    """
+    A card on the dashboard, its id matches the info_group of the measurements.
+    """
+    id: str
+    title: str
+    measurements: List[Tuple[str, str, str]]
+    controllers: List[Tuple[str, str]]
+
+
+class Greenhouse(NamedTuple):
+    """
+    A section of the dashboard, with the general info card of a greenhouse (of a hub) and the cards of its garden
+    beds.
+    """
+    general: InfoGroup
+    beds: List[InfoGroup]
+
+
+def parse_location(device_id: str) -> Tuple[int, Optional[int]]:
+    """
+    Parses the greenhouse and garden bed a device belongs to from its id. Ids, that do not match the pattern, belong
+    to the whole unnumbered greenhouse.
+
+    ---
+
+    Args:
+        device_id: The device's id, e.g. 'SoilSensorsDevice-2-1' or 'HeaterController'.
+
+    Returns:
+        The greenhouse and garden bed numbers, starting at 1. The greenhouse is 0, if the id carries no greenhouse
+        number, the bed is None for devices of a whole greenhouse.
+    """
+    device_type, *numbers = device_id.split('-')
+
+    if not all(number.isdigit() and int(number) > 0 for number in numbers):
+        return 0, None
+
+    numbers = [int(number) for number in numbers]
+
+    if device_type in BED_DEVICE_TYPES and 1 <= len(numbers) <= 2:
+        return (numbers[0] if len(numbers) == 2 else 0), numbers[-1]
+
+    if device_type not in BED_DEVICE_TYPES and len(numbers) <= 1:
+        return (numbers[0] if numbers else 0), None
+
+    return 0, None
+
+
+class DeviceRegistry:
+    """
+    A registry of devices, backed by a file with one device id per line. Lines starting with '#' are ignored.
+
+    ---
+
+    Attributes:
+        file: The file the device ids are read from.
+        hub_for: Returns the name of the hub, a device is registered at. None, if there is a single hub.
+        device_ids: The registered device ids.
+        version: Changes whenever the registered devices change.
+    """
+
+    def __init__(self, file: str, hub_for: Callable[[str], str] = None):
+        self.file = file
+        self.hub_for = hub_for
+        self.device_ids: List[str] = []
+        self.version = ''
+
+        self._mtime = None
+        self._greenhouses: List[Greenhouse] = []
+        self._lock = threading.Lock()
+
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """
+        Reloads the registry, if its file has changed. Only stats the file otherwise.
+
+        ---
+
+        Returns:
+            True if the registry was reloaded, else False.
+        """
+        try:
+            mtime = os.stat(self.file).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        if mtime == self._mtime:
+            return False
+
+        with self._lock:
+            device_ids = []
+
+            if mtime is not None:
+                with open(self.file) as f:
+                    device_ids = [line.strip() for line in f.read().splitlines()
+                                  if line.strip() and not line.strip().startswith('#')]
+
+            self.device_ids = device_ids
+            self.version = hashlib.sha1(
+                '\n'.join(sorted(device_ids)).encode('utf-8')).hexdigest()[:12]
+            self._greenhouses = self._build_greenhouses(device_ids)
+            self._mtime = mtime
+
+        return True
+
+    @property
+    def greenhouses(self) -> List[Greenhouse]:
+        """
+        Returns:
+            The sections of the dashboard, one per greenhouse in order, grouped by hub.
+        """
+        return self._greenhouses
+
+    @property
+    def info_groups(self) -> List[InfoGroup]:
+        """
+        Returns:
+            The cards of the dashboard, per greenhouse the general info first, followed by the garden beds in order.
+        """
+        return [info_group for greenhouse in self._greenhouses for info_group in [greenhouse.general] + greenhouse.beds]
+
+    def _build_greenhouses(self, device_ids: List[str]) -> List[Greenhouse]:
+        """
+        Groups the devices per hub and greenhouse into the general info and one info group per garden bed.
+        """
+        locations = {device_id: (self.hub_for(device_id) if self.hub_for else '',) + parse_location(device_id)
+                     for device_id in device_ids}
+
+        # only ids, that carry a greenhouse number, are qualified by it, so adding a greenhouse renames nothing
+        def prefix(hub: str, greenhouse: int) -> str:
+            return (f'{hub}/' if hub else '') + (f'greenhouse-{greenhouse}/' if greenhouse else '')
+
+        def title(hub: str, greenhouse: int) -> str:
+            parts = [hub] if hub else []
+
+            if greenhouse:
+                parts.append(f'Greenhouse {greenhouse}')
+
+            return ', '.join(parts) or 'General'
+
+        # info groups by (hub, greenhouse, bed), the general info has bed 0 and is shown even without devices
+        groups: Dict[Tuple[str, int, int], InfoGroup] = {
+            (hub, greenhouse, 0): InfoGroup(f'{prefix(hub, greenhouse)}general-info', title(hub, greenhouse), [], [])
+            for hub, greenhouse in {(hub, greenhouse) for hub, greenhouse, _ in locations.values()} or {('', 0)}}
+
+        for device_id, (hub, greenhouse, bed) in locations.items():
+            device_type, _, _ = device_id.partition('-')
+
+            if bed is None:
+                group = groups[(hub, greenhouse, 0)]
+            else:
+                group = groups.get((hub, greenhouse, bed))
+
+                if group is None:
+                    group = groups[(hub, greenhouse, bed)] = InfoGroup(
+                        f'{prefix(hub, greenhouse)}garden-bed-{bed}', f'Garden bed {bed}', [], [])
+
+            group.measurements.extend(SENSOR_MEASUREMENTS.get(device_type, []))
+
+            if device_type in CONTROLLER_LABELS:
+                group.controllers.append(
+                    (device_id, CONTROLLER_LABELS[device_type]))
+
+        greenhouses: Dict[Tuple[str, int], Greenhouse] = {}
+
+        for (hub, greenhouse, bed), group in sorted(groups.items()):
+            if bed == 0:
+                greenhouses[(hub, greenhouse)] = Greenhouse(group, [])
+            else:
+                greenhouses[(hub, greenhouse)].beds.append(group)
+
+        return list(greenhouses.values())
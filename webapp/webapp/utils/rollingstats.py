@@ -0,0 +1,266 @@
+"""
+This module implements streaming statistics over rolling time windows. Each reading is added in O(1) (amortized)
+and no history is ever rescanned:
+
+- count, mean and standard deviation with Welford's algorithm, which also supports removing values
+- minimum and maximum with monotonic deques
+- percentiles with a quantile sketch with bounded relative error, which also supports removing values
+"""
+
+from collections import deque
+from typing import Any, Dict, Mapping, Tuple
+import itertools
+import threading
+import math
+import time
+
+
+def is_reading(value: Any) -> bool:
+    """
+    Returns:
+        True if the value is a finite number. JSON allows NaN and infinite values, and booleans are ints.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+
+    try:
+        return math.isfinite(value)
+    except OverflowError:
+        return False
+
+
+class QuantileSketch:
+    """
+    A quantile sketch with logarithmic buckets (like DDSketch). Quantiles are accurate up to relative_accuracy,
+    its size only depends on the range of the values, not their number.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+
+        self._positive: Dict[int, int] = {}
+        self._negative: Dict[int, int] = {}
+        self._zeros = 0
+        self.count = 0
+
+    def add(self, value: float):
+        self._update(value, 1)
+
+    def remove(self, value: float):
+        """
+        Removes a value, that was added before.
+        """
+        self._update(value, -1)
+
+    def _update(self, value: float, delta: int):
+        self.count += delta
+
+        if value == 0:
+            self._zeros += delta
+            return
+
+        buckets = self._positive if value > 0 else self._negative
+        key = math.ceil(math.log(abs(value)) / self._log_gamma)
+        count = buckets.get(key, 0) + delta
+
+        if count:
+            buckets[key] = count
+        else:
+            del buckets[key]
+
+    def quantile(self, q: float) -> float:
+        """
+        Returns:
+            The estimated q-quantile (0 <= q <= 1), None if the sketch is empty.
+        """
+        if self.count <= 0:
+            return None
+
+        rank = round(q * (self.count - 1))
+        seen = 0
+
+        # from the most negative over zero to the most positive value
+        for key in sorted(self._negative, reverse=True):
+            seen += self._negative[key]
+            if seen > rank:
+                return -self._bucket_value(key)
+
+        seen += self._zeros
+        if seen > rank:
+            return 0.0
+
+        for key in sorted(self._positive):
+            seen += self._positive[key]
+            if seen > rank:
+                return self._bucket_value(key)
+
+        return self._bucket_value(max(self._positive)) if self._positive else 0.0
+
+    def _bucket_value(self, key: int) -> float:
+        return 2 * self._gamma ** key / (self._gamma + 1)
+
+
+class RollingWindow:
+    """
+    Statistics of the readings within the last window_in_secs seconds.
+    """
+
+    def __init__(self, window_in_secs: float, relative_accuracy: float = 0.01):
+        self.window_in_secs = window_in_secs
+
+        self._readings = deque()
+        self._seq = itertools.count()
+        self._min = deque()
+        self._max = deque()
+        self._sketch = QuantileSketch(relative_accuracy)
+
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, now: float, value: float):
+        """
+        Adds a reading and expires the readings, that left the window.
+
+        ---
+
+        Args:
+            now: Monotonic time of the reading.
+            value: The measured value.
+        """
+        seq = next(self._seq)
+        self._readings.append((now, seq, value))
+
+        # a new value makes all larger (smaller) values before it irrelevant for the minimum (maximum)
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((seq, value))
+
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((seq, value))
+
+        self._count += 1
+        delta = value - self._mean
+        self._mean += delta / self._count
+        self._m2 += delta * (value - self._mean)
+
+        self._sketch.add(value)
+        self.expire(now)
+
+    def expire(self, now: float):
+        """
+        Removes the readings, that are older than the window.
+        """
+        oldest_allowed = now - self.window_in_secs
+
+        while self._readings and self._readings[0][0] < oldest_allowed:
+            _, seq, value = self._readings.popleft()
+
+            if self._min[0][0] == seq:
+                self._min.popleft()
+            if self._max[0][0] == seq:
+                self._max.popleft()
+
+            if self._count == 1:
+                self._count, self._mean, self._m2 = 0, 0.0, 0.0
+            else:
+                self._count -= 1
+                delta = value - self._mean
+                self._mean -= delta / self._count
+                self._m2 -= delta * (value - self._mean)
+
+            self._sketch.remove(value)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Returns:
+            count, min, max, mean, stddev and the 50th, 90th and 99th percentile of the window.
+        """
+        if not self._count:
+            return {'count': 0}
+
+        minimum, maximum = self._min[0][1], self._max[0][1]
+
+        # the sketch's estimates may lie slightly outside of the values
+        def quantile(q: float) -> float:
+            return min(maximum, max(minimum, self._sketch.quantile(q)))
+
+        return {
+            'count': self._count,
+            'min': minimum,
+            'max': maximum,
+            'mean': self._mean,
+            'stddev': math.sqrt(max(0.0, self._m2 / self._count)),
+            'p50': quantile(0.5),
+            'p90': quantile(0.9),
+            'p99': quantile(0.99),
+        }
+
+
+class StatisticsCollector:
+    """
+    Keeps rolling windows per info_group and measurement. An instance can be added as listener to a
+    SimpleMessageReceiver.
+    """
+
+    def __init__(self, windows_in_secs: Mapping[str, float] = None):
+        """
+        Initializes the collector.
+
+        ---
+
+        Args:
+            windows_in_secs: The windows' lengths in seconds by name (default is 1, 15 and 60 minutes).
+        """
+        self.windows_in_secs = dict(
+            windows_in_secs or {'1m': 60, '15m': 900, '60m': 3600})
+
+        self._windows: Dict[Tuple[str, str], Dict[str, RollingWindow]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, info_group: str, measurements: Mapping[str, Any]):
+        """
+        Adds the readings of a message.
+
+        ---
+
+        Args:
+            info_group: The info group of the measurements.
+            measurements: The measured values by name.
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            for measurement, value in measurements.items():
+                if not is_reading(value):
+                    continue
+
+                windows = self._windows.get((info_group, measurement))
+
+                if windows is None:
+                    windows = self._windows[(info_group, measurement)] = {
+                        name: RollingWindow(window_in_secs) for name, window_in_secs in self.windows_in_secs.items()}
+
+                for window in windows.values():
+                    window.add(now, value)
+
+    def summaries(self) -> Dict[str, Dict[str, Dict[str, Dict[str, Any]]]]:
+        """
+        Returns:
+            The summaries of all windows by info_group, measurement and window name.
+        """
+        now = time.monotonic()
+        summaries = {}
+
+        with self._lock:
+            for (info_group, measurement), windows in self._windows.items():
+                for window in windows.values():
+                    window.expire(now)
+
+                summaries.setdefault(info_group, {})[measurement] = {
+                    name: window.summary() for name, window in windows.items()}
+
+        return summaries